@@ -0,0 +1,69 @@
+'''
+Import time of randoor, checked against a budget. Exit status is 1 if the budget is exceeded
+or a lazily loaded dependency is imported at startup.
+
+usage (from repository root):
+    python -m benchmarks.bench_import
+    python -m benchmarks.bench_import --module randoor.generator --budget-ms 40
+'''
+import argparse
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+# must not be imported by "import randoor.generator"
+LAZY_MODULES = ['sklearn', 'scipy', 'trimesh', 'quaternion', 'multiprocessing']
+# required dependencies, imported beforehand so that their import time is not charged to the budget
+BASE_MODULES = ['numpy', 'shapely', 'shapely.geometry', 'shapely.ops']
+
+def import_times(statement):
+    '''
+    -> {module: cumulative microseconds} of one fresh interpreter running statement
+    '''
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None) # measure with cached bytecode
+    env['PYTHONPATH'] = os.pathsep.join([os.getcwd()] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], env=env, stderr=subprocess.PIPE, check=True).stderr
+    times = dict()
+    for line in out.decode().splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='randoor.generator')
+    parser.add_argument('--budget-ms', type=float, default=15.0, help='budget of median import time on top of required dependencies')
+    parser.add_argument('--repeat', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    statement = 'import {}'.format(args.module)
+    import_times(statement) # warm up bytecode cache
+
+    totals, owns = [], []
+    for _ in range(args.repeat):
+        times = import_times(statement)
+        totals.append(times[args.module])
+        owns.append(import_times('import {}; {}'.format(', '.join(BASE_MODULES), statement))[args.module])
+    total_ms = np.median(totals) / 1e3
+    own_ms = np.median(owns) / 1e3
+
+    loaded = [m for m in LAZY_MODULES if m in times]
+    print('{:<32} {:>9.1f} ms'.format(statement, total_ms))
+    print('{:<32} {:>9.1f} ms (budget {:.1f} ms)'.format('without required dependencies', own_ms, args.budget_ms))
+
+    ok = True
+    if own_ms > args.budget_ms:
+        print('FAIL: import time exceeds budget')
+        ok = False
+    if loaded:
+        print('FAIL: imported at startup: {}'.format(', '.join(loaded)))
+        ok = False
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+'''
+Benchmarks of room generation and RoomConfig queries.
+
+usage (from repository root):
+    python -m benchmarks.bench_rooms --output results.json
+    python -m benchmarks.bench_rooms --output new.json --compare results.json
+'''
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from randoor.generator import EmptyRoomGenerator, ObstacleRoomGenerator, SimpleSearchRoomGenerator, ChestSearchRoomGenerator
+from randoor.spawner.poly import get_clustered_zones
+from randoor.spawner.wall import WALL_STYLES
+
+OBSTACLE_COUNTS = [5, 10, 30]
+ROOM_LENGTHS = [6, 9, 15, 50]
+GRID_SIZES = [128, 256, 512]
+GRID_RESOLUTIONS = [0.05, 0.1]
+
+def seeded(generator, seed=0):
+    generator.rng = np.random.default_rng(seed)
+    return generator
+
+def generator_cases():
+    for length in ROOM_LENGTHS:
+        for style in WALL_STYLES:
+            g = seeded(EmptyRoomGenerator(room_length_max=length, wall_style=style))
+            yield 'generate_new', dict(generator='EmptyRoomGenerator', room_length_max=length, wall_style=style), g.generate_new
+        for count in OBSTACLE_COUNTS:
+            for cls in [ObstacleRoomGenerator, SimpleSearchRoomGenerator, ChestSearchRoomGenerator]:
+                g = seeded(cls(obstacle_count=count, room_length_max=length))
+                yield 'generate_new', dict(generator=cls.__name__, obstacle_count=count, room_length_max=length), g.generate_new
+    for count in [50, 200]:
+        g = seeded(ObstacleRoomGenerator(obstacle_count=count, room_length_max=30, obstacle_placement='spaced'))
+        yield 'generate_new', dict(generator='ObstacleRoomGenerator', obstacle_count=count, room_length_max=30, obstacle_placement='spaced'), g.generate_new
+
+def query_cases():
+    for count in OBSTACLE_COUNTS:
+        params = dict(obstacle_count=count, room_length_max=9)
+        g = seeded(ChestSearchRoomGenerator(**params))
+        room = g.generate_new()
+        obstacles = room.get_polygons(room.tag_obstacle)
+
+        def uncached(get, room=room):
+            def run():
+                room.spaces.clear()
+                room.unions.clear()
+                return get()
+            return run
+
+        yield 'get_freespace_poly', params, uncached(room.get_freespace_poly)
+        yield 'get_freezone_poly', params, uncached(room.get_freezone_poly)
+        yield 'reposition_target', params, lambda g=g, room=room: g.reposition_target(room)
+        yield 'reposition_key', params, lambda g=g, room=room: g.reposition_key(room)
+        yield 'get_clustered_zones', params, lambda obstacles=obstacles, g=g: get_clustered_zones(obstacles, g.obstacle_zone_thresh)
+        yield 'geodesic_distance', params, lambda room=room: room.geodesic_distance(room.get_positions(room.tag_key)[:,:2], room.get_positions(room.tag_target)[:,:2])
+        yield 'simulate_scan', dict(params, poses=1), lambda room=room: room.simulate_scan(0.0, 0.0, 0.0, 360, 10.0)
+        yield 'simulate_scan', dict(params, poses=256), lambda room=room: room.simulate_scan(np.linspace(-2, 2, 256), 0.0, 0.0, 360, 10.0)
+
+        free = room.get_freespace_poly()
+        for size in GRID_SIZES:
+            for res in GRID_RESOLUTIONS:
+                grid_params = dict(params, map_size=size, resolution=res)
+                yield 'get_occupancy_grid', grid_params, lambda free=free, room=room, size=size, res=res: room.get_occupancy_grid(free, resolution=res, map_size=size)
+
+def measure(func, repeat, min_time):
+    func() # warm up
+    times = []
+    start = time.perf_counter()
+    while (len(times) < repeat) or (time.perf_counter() - start < min_time):
+        t = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    times = np.array(times)
+    return dict(
+        runs=len(times),
+        min=float(times.min()),
+        median=float(np.median(times)),
+        mean=float(times.mean()),
+        peak_memory=int(peak),
+    )
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def case_key(case):
+    return case['name'] + json.dumps(case['params'], sort_keys=True)
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = dict((case_key(c), c) for c in json.load(f)['cases'])
+    print('{:<90} {:>10} {:>10} {:>8}'.format('case', 'base[ms]', 'new[ms]', 'ratio'))
+    for case in results['cases']:
+        base = baseline.get(case_key(case))
+        if base is None:
+            continue
+        ratio = case['median'] / base['median']
+        print('{:<90} {:>10.3f} {:>10.3f} {:>8.2f}'.format(case_key(case), base['median']*1e3, case['median']*1e3, ratio))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', default=None, help='baseline json to compare medians with')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum seconds per case')
+    parser.add_argument('--filter', default=None, help='run only cases whose name contains this')
+    args = parser.parse_args(argv)
+
+    cases = []
+    for source in [generator_cases, query_cases]:
+        for name, params, func in source():
+            if (args.filter is not None) and (args.filter not in name):
+                continue
+            result = measure(func, args.repeat, args.min_time)
+            result.update(name=name, params=params)
+            cases.append(result)
+            print('{:<24} {:<70} {:>9.3f} ms {:>9.1f} KiB'.format(name, json.dumps(params, sort_keys=True), result['median']*1e3, result['peak_memory']/1024.))
+            sys.stdout.flush()
+
+    results = dict(
+        revision=git_revision(),
+        python=platform.python_version(),
+        numpy=np.__version__,
+        shapely=__import__('shapely').__version__,
+        cases=cases,
+    )
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=1)
+
+    if args.compare is not None:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
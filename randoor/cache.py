@@ -0,0 +1,277 @@
+'''
+Content-addressed on-disk cache of generated rooms.
+
+    cache = RoomCache('~/.cache/randoor', max_bytes=2**30)
+    room = cache.generate(ChestSearchRoomGenerator(obstacle_count=20), seed=7)
+    room, grid = cache.generate(generator, seed=7, with_grid=dict(map_size=256))
+
+Entries are addressed by a hash of the generator class, its parameters, the package version and source,
+and the seed, so a warm restart returns the rooms of a previous run without generating them.
+Entries are pickled: only use cache directories written by trusted code.
+'''
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import time
+
+import numpy as np
+
+from . import __version__
+from . import profiling
+from .generator_factory import _generate_seeded
+
+ENTRY_SUFFIX = '.room'
+GRID_SUFFIX = '.grid'
+LOCK_NAME = 'evict.lock'
+
+_replace = getattr(os, 'replace', os.rename) # python 2: rename is atomic on POSIX
+_source_digest = None
+
+def source_digest():
+    '''
+    Hash of package version and sources, so that edited generators do not hit rooms of the old code.
+    '''
+    global _source_digest
+    if _source_digest is None:
+        h = hashlib.sha256(__version__.encode('utf-8'))
+        root = os.path.dirname(os.path.abspath(__file__))
+        for base, dirs, files in sorted(os.walk(root)):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith('.py'):
+                    with open(os.path.join(base, name), 'rb') as f:
+                        h.update(os.path.relpath(os.path.join(base, name), root).encode('utf-8'))
+                        h.update(f.read())
+        _source_digest = h.hexdigest()
+    return _source_digest
+
+def _plain(value):
+    return isinstance(value, (bool, int, float, str, tuple, list, type(None), np.integer, np.floating))
+
+def generator_params(generator):
+    '''
+    {name: value} of public plain attributes of generator and its classes, rng excluded.
+    '''
+    params = dict()
+    for cls in reversed(type(generator).__mro__):
+        params.update((k, v) for k, v in vars(cls).items() if (not k.startswith('_')) and _plain(v))
+    params.update((k, v) for k, v in vars(generator).items() if (not k.startswith('_')) and (k != 'rng') and _plain(v))
+    return params
+
+def seed_key(seed):
+    if isinstance(seed, np.random.SeedSequence):
+        return [str(seed.entropy), [int(k) for k in seed.spawn_key], int(seed.pool_size)]
+    return [str(int(seed))]
+
+def room_key(generator, seed):
+    '''
+    Hex digest addressing the room generator makes from seed.
+    '''
+    cls = type(generator)
+    desc = dict(
+        generator='{}.{}'.format(cls.__module__, cls.__name__),
+        params=generator_params(generator),
+        source=source_digest(),
+        seed=seed_key(seed),
+    )
+    return hashlib.sha256(json.dumps(desc, sort_keys=True, default=repr).encode('utf-8')).hexdigest()
+
+def grid_key(key, grid_kwargs):
+    return hashlib.sha256((key + json.dumps(grid_kwargs, sort_keys=True, default=repr)).encode('utf-8')).hexdigest()
+
+class RoomCache(object):
+    """RoomCache
+
+    Directory of pickled rooms and grids with size-bounded LRU eviction.
+    Writes go to a temporary file renamed into place, so processes sharing the directory never read partial entries.
+    Hits refresh the modification time, eviction removes the least recently used files once new writes
+    exceed evict_ratio of max_bytes, and only one process evicts at a time.
+
+    Args:
+        path (str): Cache directory, created if missing.
+        max_bytes (int): Size the cache is brought back under by eviction.
+        evict_ratio (float): Bytes written by this process, relative to max_bytes, between eviction passes.
+
+    """
+    lock_timeout = 60.0
+
+    def __init__(self, path, max_bytes=2**30, evict_ratio=0.05):
+        self.path = os.path.expanduser(path)
+        self.max_bytes = max_bytes
+        self.evict_ratio = evict_ratio
+        self._written = None # None: evict on first write
+        if not os.path.isdir(self.path):
+            try:
+                os.makedirs(self.path)
+            except OSError:
+                if not os.path.isdir(self.path): # made by another process meanwhile
+                    raise
+
+    def _file(self, key, suffix):
+        return os.path.join(self.path, key[:2], key + suffix)
+
+    def _read(self, filename):
+        try:
+            with open(filename, 'rb') as f:
+                value = pickle.load(f)
+        except (IOError, OSError):
+            return None
+        except Exception: # broken entry, e.g. written by another version of python
+            self._remove(filename)
+            return None
+        try:
+            os.utime(filename, None)
+        except OSError:
+            pass
+        return value
+
+    def _write(self, filename, value):
+        directory = os.path.dirname(filename)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                pass
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            _replace(tmp, filename)
+        except BaseException:
+            self._remove(tmp)
+            raise
+        size = os.path.getsize(filename)
+        self._written = size if self._written is None else self._written + size
+        if self._written >= self.max_bytes * self.evict_ratio:
+            self.evict()
+
+    def _remove(self, filename):
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+    def get(self, key, grid_kwargs=None):
+        '''
+        -> room, or (room, grid) if grid_kwargs is set. None if not cached.
+        '''
+        room = self._read(self._file(key, ENTRY_SUFFIX))
+        if (room is None) or (grid_kwargs is None):
+            return room
+        grid = self._read(self._file(grid_key(key, grid_kwargs), GRID_SUFFIX))
+        return None if grid is None else (room, grid)
+
+    def put(self, key, room, grid=None, grid_kwargs=None):
+        '''
+        Store room without its caches and the polygons it can make again, room itself is not modified.
+        '''
+        stored = room.fork()
+        stored.clear_caches()
+        stored.release_polygons()
+        self._write(self._file(key, ENTRY_SUFFIX), stored)
+        if grid is not None:
+            self._write(self._file(grid_key(key, grid_kwargs), GRID_SUFFIX), grid)
+
+    def generate(self, generator, seed, with_grid=None):
+        """generate
+
+        Function return room generator makes from seed, loaded from the cache if present.
+        Same room as generate_batch gives for the same SeedSequence child.
+
+        Args:
+            generator (RoomGeneratorFactory): Generator, not modified.
+            seed (int, SeedSequence): Seed of the room. Not cached if None.
+            with_grid (bool, dict): Also return room.get_freespace_grid(**with_grid), True for default args.
+
+        Returns:
+            RoomConfig or (RoomConfig, ndarray): Room, with its grid if with_grid is set.
+
+        """
+        grid_kwargs = None if (with_grid is None) or (with_grid is False) else (dict() if with_grid is True else dict(with_grid))
+        if seed is None:
+            room, _ = _generate_seeded((generator, np.random.SeedSequence(), False))
+            return room if grid_kwargs is None else (room, room.get_freespace_grid(**grid_kwargs))
+
+        key = room_key(generator, seed)
+        room = self._read(self._file(key, ENTRY_SUFFIX))
+        grid = None
+        if (room is not None) and (grid_kwargs is not None):
+            grid = self._read(self._file(grid_key(key, grid_kwargs), GRID_SUFFIX))
+        if (room is not None) and ((grid_kwargs is None) or (grid is not None)):
+            profiling.count('cache.hits')
+            return room if grid_kwargs is None else (room, grid)
+        profiling.count('cache.misses')
+
+        if room is None:
+            seq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+            room, report = _generate_seeded((generator, seq, profiling.is_enabled()))
+            if report is not None:
+                profiling.current().add_room(report)
+            self.put(key, room)
+        if grid_kwargs is None:
+            return room
+        grid = room.get_freespace_grid(**grid_kwargs)
+        self._write(self._file(grid_key(key, grid_kwargs), GRID_SUFFIX), grid)
+        return room, grid
+
+    def generate_batch(self, generator, n, seed=None, with_grid=None):
+        '''
+        Iterator of the n rooms of generator.generate_batch(n, seed), each loaded from the cache if present.
+        '''
+        for child in np.random.SeedSequence(seed).spawn(n):
+            yield self.generate(generator, child, with_grid)
+
+    def entries(self):
+        '''
+        -> [(mtime, size, filename)] of all cached files.
+        '''
+        found = []
+        for base, _, files in os.walk(self.path):
+            for name in files:
+                if name.endswith(ENTRY_SUFFIX) or name.endswith(GRID_SUFFIX):
+                    filename = os.path.join(base, name)
+                    try:
+                        st = os.stat(filename)
+                    except OSError:
+                        continue
+                    found.append((st.st_mtime, st.st_size, filename))
+        return found
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        '''
+        Remove least recently used files until the cache is under max_bytes. Skipped while another process evicts.
+        '''
+        self._written = 0
+        lock = os.path.join(self.path, LOCK_NAME)
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError:
+            try:
+                if time.time() - os.path.getmtime(lock) > self.lock_timeout: # left by a killed process
+                    self._remove(lock)
+            except OSError:
+                pass
+            return
+        try:
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _ in entries)
+            evicted = 0
+            for _, size, filename in entries:
+                if total <= self.max_bytes:
+                    break
+                self._remove(filename)
+                total -= size
+                evicted += 1
+            profiling.count('cache.evicted', evicted)
+        finally:
+            os.close(fd)
+            self._remove(lock)
+
+    def clear(self):
+        for _, _, filename in self.entries():
+            self._remove(filename)
@@ -2,12 +2,18 @@ from shapely.geometry.polygon import Polygon
 from shapely.ops import unary_union
 import numpy as np
 
-from randoor.spawner.poly import simple_cube
+from randoor.spawner.poly import simple_cube, buffered_intersections
 
-from ..spawner.geom import sample_sure
+from ..spawner.geom import triangulate_areas, sample_triangulated
+from .. import profiling
+from ..generator_factory import RoomRejected
 from .simple_search_room import SimpleSearchRoomGenerator, SimpleSearchRoomConfig
 
 class ChestSearchRoomConfig(SimpleSearchRoomConfig):
+    __slots__ = ('key_shape', 'key_count', 'key_placing_area', 'key_placing_triangles')
+
+    tag_key = 'key'
+
     def __init__(self, 
                  wall_shape, 
                  obstacle_shape, 
@@ -24,11 +30,23 @@ class ChestSearchRoomConfig(SimpleSearchRoomConfig):
         self.key_shape = key_shape
         self.key_count = key_count
         self.key_placing_area = key_placing_area
-
-        self.tag_wall = 'wall'
-        self.tag_obstacle = 'obstacle'
-        self.tag_target = 'target'
-        self.tag_key = 'key'
+        # (key_placing_area triangulated, triangles, owners)
+        self.key_placing_triangles = None
+
+    def clear_caches(self):
+        super(ChestSearchRoomConfig, self).clear_caches()
+        self.key_placing_triangles = None
+
+    def get_key_placing_triangles(self):
+        '''
+        -> (triangles, owners) of key_placing_area, made again only when key_placing_area is replaced.
+        '''
+        cache = self.key_placing_triangles
+        if (cache is None) or (cache[0] is not self.key_placing_area):
+            with profiling.stage('key_placing_triangles'):
+                cache = (self.key_placing_area,) + triangulate_areas(self.key_placing_area)
+            self.key_placing_triangles = cache
+        return cache[1], cache[2]
 
     def tweak_key_collision(self, index, is_col=True):
         self.tweak_collision(self.tag_key, index, is_col)
@@ -40,13 +58,17 @@ class ChestSearchRoomConfig(SimpleSearchRoomConfig):
         self.register(self.tag_key, self.key_shape, self.key_count)
 
     def get_freezone_poly(self):
-        col_list = self.get_collision_poly_focus(self.tag_target)
-        col_list.extend(self.get_collision_poly_focus(self.tag_key))
-        col_list.extend(self.obstacle_hulls)
-        return self.get_inner_poly(self.tag_wall, unary_union(col_list))
+        def create():
+            col_list = [self.get_collision_union(self.tag_target), self.get_collision_union(self.tag_key), self.get_hull_union()]
+            return self.get_inner_poly(self.tag_wall, unary_union(col_list))
+        return self.get_cached_space('freezone', create, tags=(self.tag_wall, self.tag_target, self.tag_key))
 
 class ChestSearchRoomGenerator(SimpleSearchRoomGenerator):
+    config_class = ChestSearchRoomConfig
     key_each_count = 1
+    # placing areas smaller than this [m^2] are treated as empty
+    key_area_min = 1e-6
+    key_area_fallbacks = ['reject', 'drop', 'path_area']
 
     def __init__(self, 
                  obstacle_count=10,
@@ -58,52 +80,77 @@ class ChestSearchRoomGenerator(SimpleSearchRoomGenerator):
                  range_key_placing=0.3,
                  room_length_max=9,
                  room_wall_thickness=0.05,
-                 wall_threshold=0.1):
+                 wall_threshold=0.1,
+                 wall_style='convex',
+                 obstacle_placement='random',
+                 obstacle_gap=0.0,
+                 require_reachable=False,
+                 key_area_fallback='reject'):
 
-        super(ChestSearchRoomGenerator, self).__init__(obstacle_count, obstacle_size, target_size, obstacle_zone_thresh, room_length_max, room_wall_thickness, wall_threshold)
+        super(ChestSearchRoomGenerator, self).__init__(obstacle_count, obstacle_size, target_size, obstacle_zone_thresh, room_length_max, room_wall_thickness, wall_threshold, wall_style, obstacle_placement, obstacle_gap, require_reachable)
 
+        assert key_area_fallback in self.key_area_fallbacks, 'unknown key_area_fallback: {}'.format(key_area_fallback)
         self.key_size = key_size
         self.distance_key_placing = distance_key_placing
         self.range_key_placing = range_key_placing
-
-    def generate_new(self):
-        pre =  super(ChestSearchRoomGenerator, self).generate_new()
-        freezone = pre.get_freezone_poly()
-        zone_hull = pre.obstacle_hulls
-        hull_buff = self.distance_key_placing + self.range_key_placing
-        path_area = freezone.buffer(-self.distance_key_placing)
-        key_placing_area = [path_area.intersection(h.buffer(hull_buff)) for h in zone_hull]
-
-        key_shape = simple_cube(self.key_size)
-        key_pos = self._sample_key_pos(key_placing_area)
-        key_collision = [False for _ in range(len(key_pos))]
-
-        room = ChestSearchRoomConfig(
-            wall_shape=pre.wall_shape,
-            obstacle_shape=pre.obstacle_shape,
-            target_shape=pre.target_shape,
-            key_shape=key_shape,
-            obstacle_count=pre.obstacle_count,
-            target_count=pre.target_count,
-            key_count=len(key_pos),
-            obstacle_hulls=pre.obstacle_hulls,
-            key_placing_area=key_placing_area
+        # for hulls without room around them: 'reject' the room so that another is drawn, 'drop' their keys or place them anywhere on 'path_area'
+        self.key_area_fallback = key_area_fallback
+
+    def _create_parts(self):
+        args, items = super(ChestSearchRoomGenerator, self)._create_parts()
+        # keys are placed by _complete around the freezone of the assembled room
+        args.update(
+            key_shape=simple_cube(self.key_size),
+            key_count=len(args['obstacle_hulls']),
+            key_placing_area=None
         )
+        return args, items
 
-        room.prepare()
-        self.merge_config(pre, room)
-        room.set_config(room.tag_key, key_collision, key_pos)
-        room.set_polygons_auto(room.tag_key)
+    def _complete(self, room):
+        super(ChestSearchRoomGenerator, self)._complete(room)
+        room.set_config_collisions(room.tag_key, [False for _ in range(room.key_count)])
 
-        return room
+        freezone = room.get_freezone_poly()
+        with profiling.stage('path_area') as s:
+            path_area = s.geometry(freezone.buffer(-self.distance_key_placing))
+        with profiling.stage('key_placing_area') as s:
+            room.key_placing_area = s.geometry(self._create_key_placing_area(path_area, room.obstacle_hulls))
+        room.key_count = len(room.key_placing_area)
 
-    def _sample_key_pos(self, key_placing_areas):
-        key_pos = np.empty([len(key_placing_areas), 3])
-        key_pos[:,:2] = [sample_sure(a, self.key_each_count, self.range_key_placing)[0] for a in key_placing_areas]
+        room.set_config(room.tag_key, [False for _ in range(room.key_count)], self._sample_key_pos(room))
+        room.set_polygons_auto(room.tag_key)
+        if self.require_reachable:
+            self._check_reachable(room, [room.tag_target, room.tag_key])
+
+    def _create_key_placing_area(self, path_area, hulls):
+        '''
+        Placing area of a key around each hull, all at once. Empty or degenerate areas are handled by key_area_fallback.
+        '''
+        areas = buffered_intersections(path_area, hulls, self.distance_key_placing + self.range_key_placing)
+        empty = np.array([a.area <= self.key_area_min for a in areas], dtype=bool)
+        if not empty.any():
+            return list(areas)
+        profiling.count('key_placing_area.empty', int(empty.sum()))
+        if self.key_area_fallback == 'drop':
+            return list(areas[~empty])
+        if (self.key_area_fallback == 'path_area') and (path_area.area > self.key_area_min):
+            areas[empty] = path_area
+            return list(areas)
+        raise RoomRejected('key placing area is empty')
+
+    def _sample_key_pos(self, room_conf):
+        triangles, owners = room_conf.get_key_placing_triangles()
+        key_pos = np.empty([len(room_conf.key_placing_area), 3])
+        with profiling.stage('sample_key'):
+            key_pos[:,:2] = sample_triangulated(triangles, owners, len(key_pos), self.key_each_count, self.rng)[:,0]
         key_pos[:,2] = 0.0
         return key_pos
 
+    def reposition(self, room_conf):
+        super(ChestSearchRoomGenerator, self).reposition(room_conf)
+        self.reposition_key(room_conf)
+
     def reposition_key(self, room_conf):
-        key_pos = self._sample_key_pos(room_conf.key_placing_area)
+        key_pos = self._sample_key_pos(room_conf)
         room_conf.set_config_positions(room_conf.tag_key, key_pos)
         room_conf.set_polygons_auto(room_conf.tag_key)
\ No newline at end of file
@@ -1,53 +1,109 @@
 from shapely.geometry.polygon import Polygon
+import numpy as np
+from collections import OrderedDict
 
-from ..spawner.poly import random_triangulation
-from ..generator_factory import RoomConfig, RoomGeneratorFactory
+try:
+    from shapely import prepare, contains_xy
+except ImportError: # shapely < 2.0
+    prepare = lambda geom: None
+    from shapely.vectorized import contains as contains_xy
+
+from .. import profiling
+from ..spawner.wall import random_room, wall_from_room
+from ..generator_factory import RoomConfig, RoomGeneratorFactory, RoomRejected
 
 class EmptyRoomConfig(RoomConfig):
+    __slots__ = ('wall_shape', 'wall_interior_polygon', 'wall_exterior_polygon')
+
+    tag_wall = 'wall'
+
     def __init__(self, wall_shape):
         super(EmptyRoomConfig, self).__init__()
         self.wall_shape = wall_shape
 
         self.wall_interior_polygon = Polygon(self.wall_shape.interiors[0])
+        prepare(self.wall_interior_polygon)
         self.wall_exterior_polygon = None
 
-        self.tag_wall = 'wall'
-
     def prepare(self):
         self.register(self.tag_wall, self.wall_shape, 1)
 
     def get_freespace_poly(self):
         return self.get_space_poly(self.tag_wall)
 
+    def is_free(self, x, y):
+        '''
+        Whether points are inside the room and touch no collision polygon. Accepts scalars or arrays.
+        '''
+        index, _ = self.get_polygon_index(collision=True)
+        free = contains_xy(self.wall_interior_polygon, x, y) & ~index.hit_any(x, y)
+        return bool(free) if np.ndim(free) == 0 else free
+
 class EmptyRoomGenerator(RoomGeneratorFactory):
+    config_class = EmptyRoomConfig
+
     def __init__(self, 
                  room_length_max=9,
-                 room_wall_thickness=0.05):
-        
+                 room_wall_thickness=0.05,
+                 wall_style='convex'):
+        '''
+        note: wall_style is one of spawner.wall.WALL_STYLES, 'convex' gives the original convex rooms.
+        '''
         super(EmptyRoomGenerator, self).__init__()
         self.room_length_max = room_length_max
         self.room_wall_thickness = room_wall_thickness
+        self.wall_style = wall_style
 
     def _create_wall_poly(self):
-        n_points = self.room_length_max * 6
-        x_max = self.room_length_max / 2
-        x_min = -x_max
-        y_max = x_max
-        y_min = -x_max
-        p = random_triangulation(n_points, x_min, x_max, y_min, y_max)
-        return p.exterior.buffer(self.room_wall_thickness, join_style=2) # mitre style
-
-    def generate_new(self):
+        with profiling.stage('wall_shape') as s:
+            p = s.geometry(random_room(self.wall_style, self.room_length_max, self.rng))
+        with profiling.stage('wall_buffer') as s:
+            return s.geometry(wall_from_room(p, self.room_wall_thickness))
+
+    def _create_parts(self):
+        '''
+        -> (constructor kwargs of config_class, {tag: (collisions, positions, polygons or None to move base shape)})
+        note: subclasses extend parts of parent, so that generate_new builds only the final config.
+        '''
         wall_shape = self._create_wall_poly()
-        wall_collision = [True]
-        wall_pos = [(0,0,0)]
+        items = OrderedDict()
+        items[EmptyRoomConfig.tag_wall] = ([True], [(0,0,0)], None)
+        return dict(wall_shape=wall_shape), items
+
+    def _complete(self, room):
+        '''
+        Fill parts that need the assembled room.
+        '''
+        pass
+
+    @profiling.room_stage
+    def generate_new(self, max_attempts=None):
+        '''
+        note: rooms rejected while generated (RoomRejected) are drawn again from self.rng, up to max_attempts times
+        (self.max_attempts if None). RoomRejected is raised if all of them are rejected.
+        '''
+        max_attempts = self.max_attempts if max_attempts is None else max_attempts
+        assert max_attempts >= 1, 'max_attempts must be positive'
+        for _ in range(max_attempts):
+            try:
+                return self._generate_room()
+            except RoomRejected as e:
+                profiling.count('rejected')
+                reason = str(e)
+        raise RoomRejected('{} ({} attempts)'.format(reason, max_attempts))
 
-        emp_room = EmptyRoomConfig(
-            wall_shape=wall_shape
-        )
+    def _generate_room(self):
+        args, items = self._create_parts()
 
-        emp_room.prepare()
-        emp_room.set_config(emp_room.tag_wall, wall_collision, wall_pos)
-        emp_room.set_polygons_auto(emp_room.tag_wall)
+        with profiling.stage('build_config'):
+            room = self.config_class(**args)
+            room.prepare()
+            for tag, (collisions, positions, polys) in items.items():
+                room.set_config(tag, collisions, positions)
+                if polys is None:
+                    room.set_polygons_auto(tag)
+                else:
+                    room.set_polygons_direct(tag, polys)
 
-        return emp_room
\ No newline at end of file
+        self._complete(room)
+        return room
\ No newline at end of file
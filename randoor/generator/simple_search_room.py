@@ -4,9 +4,18 @@ import numpy as np
 
 from ..spawner.poly import sprinkle_cube, simple_cube, get_clustered_zones
 from ..spawner.geom import sample_from_faces
+from ..nav import NavGraph
+from .. import profiling
+from ..generator_factory import RoomRejected
 from .obstacle_room import ObstacleRoomConfig, ObstacleRoomGenerator
 
 class SimpleSearchRoomConfig(ObstacleRoomConfig):
+    __slots__ = ('target_shape', 'target_count', '_obstacle_hulls')
+
+    tag_target = 'target'
+    # segments per quarter circle of arcs made by clearance, each arc vertex is a node of NavGraph
+    nav_quad_segs = 4
+
     def __init__(self, 
                  wall_shape, 
                  obstacle_shape, 
@@ -21,9 +30,17 @@ class SimpleSearchRoomConfig(ObstacleRoomConfig):
         self.target_count = target_count
         self.obstacle_hulls = obstacle_hulls
 
-        self.tag_wall = 'wall'
-        self.tag_obstacle = 'obstacle'
-        self.tag_target = 'target'
+    @property
+    def obstacle_hulls(self):
+        '''
+        note: hulls are not a layout tag, so replacing them drops all caches.
+        '''
+        return self._obstacle_hulls
+
+    @obstacle_hulls.setter
+    def obstacle_hulls(self, hulls):
+        self._obstacle_hulls = hulls
+        self.clear_caches()
 
     def tweak_target_collision(self, index, is_col=True):
         self.tweak_collision(self.tag_target, index, is_col)
@@ -33,12 +50,80 @@ class SimpleSearchRoomConfig(ObstacleRoomConfig):
         self.register(self.tag_obstacle, self.obstacle_shape, self.obstacle_count)
         self.register(self.tag_target, self.target_shape, self.target_count)
 
+    def get_hull_union(self):
+        return self.get_cached_space('hulls', lambda: unary_union(self.obstacle_hulls), tags=())
+
     def get_freezone_poly(self):
-        col_list = self.get_collision_poly_focus(self.tag_target)
-        col_list.extend(self.obstacle_hulls)
-        return self.get_inner_poly(self.tag_wall, unary_union(col_list))
+        def create():
+            col_list = [self.get_collision_union(self.tag_target), self.get_hull_union()]
+            return self.get_inner_poly(self.tag_wall, unary_union(col_list))
+        return self.get_cached_space('freezone', create, tags=(self.tag_wall, self.tag_target))
+
+    def get_freezone_grid(self, origin_pos=(0,0), origin_ori=0, resolution=0.05, map_size=512, pass_color=255, obs_color=0):
+        return self.get_space_grid('freezone', origin_pos, origin_ori, resolution, map_size, pass_color, obs_color)
+
+    def get_nav_graph(self, space='freezone', clearance=0.0):
+        '''
+        NavGraph of get_<space>_poly() shrunk by clearance. Rebuilt only when the space geometry changed,
+        so moving targets and keys without collision keeps it.
+        '''
+        space_poly = getattr(self, 'get_{}_poly'.format(space))()
+        key = (space, clearance)
+        entry = self.nav_graphs.get(key)
+        if (entry is None) or ((entry[0] is not space_poly) and (not entry[0].equals_exact(space_poly, 0))):
+            with profiling.stage('nav_graph'):
+                # positional: quad_segs on shapely >= 2.0, resolution before
+                nav_poly = space_poly.buffer(-clearance, self.nav_quad_segs) if clearance > 0 else space_poly
+                entry = (space_poly, NavGraph(nav_poly))
+        self.nav_graphs[key] = (space_poly, entry[1])
+        return entry[1]
+
+    def geodesic_distance(self, points_a, points_b, space='freezone', clearance=0.0):
+        """geodesic_distance
+
+        Function return shortest path lengths through get_<space>_poly() between all pairs of points.
+
+        Args:
+            points_a (ndarray): (M,2) points.
+            points_b (ndarray): (K,2) points.
+            space (str): 'freezone' or 'freespace'.
+            clearance (float): Min distance of paths from obstacles.
+
+        Returns:
+            ndarray: (M,K) lengths, inf if not connected or a point is outside the space.
+
+        """
+        return self.get_nav_graph(space, clearance).geodesic_distance(points_a, points_b)
+
+    def get_path(self, start, goal, space='freezone', clearance=0.0):
+        '''
+        -> (L,2) waypoints of shortest path from start to goal, None if not connected.
+        '''
+        return self.get_nav_graph(space, clearance).path(start, goal)
+
+    def get_components(self, space='freezone', clearance=0.0):
+        '''
+        -> [Polygon] connected parts of space, indices are the labels of get_component_labels.
+        '''
+        return self.get_nav_graph(space, clearance).parts
+
+    def get_component_labels(self, points, space='freezone', clearance=0.0, tolerance=0.0):
+        '''
+        -> (M,) index of connected part of space each point is in (within tolerance), -1 if none.
+        '''
+        return self.get_nav_graph(space, clearance).component_of(points, tolerance)
+
+    def is_reachable(self, tags=None, space='freespace', clearance=0.0):
+        '''
+        Whether positions of all items of tags (targets if None) are in the same connected part of space.
+        '''
+        tags = [self.tag_target] if tags is None else tags
+        points = np.concatenate([self.get_positions(tag)[:,:2] for tag in tags])
+        labels = self.get_component_labels(points, space, clearance)
+        return bool(np.all(labels >= 0) and np.all(labels == labels[0])) if len(labels) > 0 else True
 
 class SimpleSearchRoomGenerator(ObstacleRoomGenerator):
+    config_class = SimpleSearchRoomConfig
     target_each_count = 1
     target_sample_face = 0.01
 
@@ -49,49 +134,65 @@ class SimpleSearchRoomGenerator(ObstacleRoomGenerator):
                  obstacle_zone_thresh=1.5,
                  room_length_max=9,
                  room_wall_thickness=0.05,
-                 wall_threshold=0.1):
+                 wall_threshold=0.1,
+                 wall_style='convex',
+                 obstacle_placement='random',
+                 obstacle_gap=0.0,
+                 require_reachable=False):
 
-        super(SimpleSearchRoomGenerator, self).__init__(obstacle_count, obstacle_size, room_length_max, room_wall_thickness, wall_threshold)
+        super(SimpleSearchRoomGenerator, self).__init__(obstacle_count, obstacle_size, room_length_max, room_wall_thickness, wall_threshold, wall_style, obstacle_placement, obstacle_gap)
 
         self.obstacle_zone_thresh = obstacle_zone_thresh
         self.target_size = target_size
+        # draw again rooms whose search objects are split across disconnected parts of the freespace
+        self.require_reachable = require_reachable
 
-    def generate_new(self):
-        pre = super(SimpleSearchRoomGenerator, self).generate_new()
+    def _create_parts(self):
+        args, items = super(SimpleSearchRoomGenerator, self)._create_parts()
 
-        zone_polys, zone_hull = get_clustered_zones(pre.get_polygons(pre.tag_obstacle), self.obstacle_zone_thresh)
-        target_shape = simple_cube(self.target_size)
+        obstacle_polys = items[SimpleSearchRoomConfig.tag_obstacle][2]
+        with profiling.stage('get_clustered_zones') as s:
+            zone_polys, zone_hull = get_clustered_zones(obstacle_polys, self.obstacle_zone_thresh)
+            s.geometry(zone_hull)
         target_pos = self._sample_target_pos(zone_hull)
         target_collision = [False for _ in range(len(target_pos))]
-        
 
-        room = SimpleSearchRoomConfig(
-            wall_shape=pre.wall_shape,
-            obstacle_shape=pre.obstacle_shape,
-            target_shape=target_shape,
-            obstacle_count=self.obstacle_count,
+        args.update(
+            target_shape=simple_cube(self.target_size),
             target_count=len(target_pos),
             obstacle_hulls=zone_hull
         )
+        items[SimpleSearchRoomConfig.tag_target] = (target_collision, target_pos, None)
+        return args, items
 
-        room.prepare()
-        self.merge_config(pre, room)
-        room.set_config(room.tag_target, target_collision, target_pos)
-        room.set_polygons_auto(room.tag_target)
+    def _complete(self, room):
+        super(SimpleSearchRoomGenerator, self)._complete(room)
+        if self.require_reachable:
+            self._check_reachable(room, [room.tag_target])
 
-        return room
+    def _check_reachable(self, room, tags):
+        with profiling.stage('check_reachable'):
+            reachable = room.is_reachable(tags)
+        if not reachable:
+            raise RoomRejected('search objects are not reachable from each other')
 
     def _sample_target_pos(self, hulls):
         target_placing_hull = [h.buffer(self.wall_threshold) for h in hulls]
         target_pos = np.empty([len(hulls), 3])
-        target_pos[:,:2] = sample_from_faces(
-            polys=target_placing_hull, 
-            count=self.target_each_count, 
-            face_size=self.target_sample_face
-        )[:,0]
+        with profiling.stage('sample_from_faces'):
+            target_pos[:,:2] = sample_from_faces(
+                polys=target_placing_hull, 
+                count=self.target_each_count, 
+                face_size=self.target_sample_face,
+                rng=self.rng
+            )[:,0]
         target_pos[:,2] = 0.0
         return target_pos
     
+    def reposition(self, room_conf):
+        super(SimpleSearchRoomGenerator, self).reposition(room_conf)
+        self.reposition_target(room_conf)
+
     def reposition_target(self, room_conf):
         target_pos = self._sample_target_pos(room_conf.obstacle_hulls)
         room_conf.set_config_positions(room_conf.tag_target, target_pos)
@@ -1,67 +1,651 @@
 import abc
+import copy
+import os
+import threading
+from collections import OrderedDict, deque
 import numpy as np
-from numpy.lib.arraysetops import isin
-import shapely
-from shapely.geometry import Polygon, Point, MultiPolygon
+from shapely.geometry import Polygon, MultiPolygon, GeometryCollection
 from shapely.ops import unary_union
-from multiprocessing import Pool, Array
-from contextlib import closing
 
-from .utils import vec_to_transform_matrix, radian_to_rotation_matrix
-from .spawner.poly import get_moved_poly_rt_tf, get_moved_poly_tf_rt, get_affine_rt_tf
-from randoor.spawner import poly
+try:
+    import queue
+except ImportError: # python 2
+    import Queue as queue
+
+from .raster import rasterize, rasterize_into, get_grid_axis, polygon_mask, update_mask, colorize, distance_transform, inflate
+from .index import PolygonIndex
+from .scan import SegmentGrid, polygon_segments
+from .tiles import TiledOccupancy
+from .layout import RoomLayout
+from . import profiling
+from .spawner.poly import get_moved_polys_tf_rt
+
+class RoomRejected(ValueError):
+    '''
+    Raised for a room that does not meet the constraints of its generator, e.g. an empty key placing area.
+    generate_new draws such rooms again up to max_attempts times before passing it to the caller.
+    '''
+
+def _attempt_seed(seed_seq, attempt):
+    '''
+    SeedSequence of attempt-th try of a room: seed_seq itself, then its children in spawn order.
+    '''
+    if attempt == 0:
+        return seed_seq
+    return np.random.SeedSequence(seed_seq.entropy, spawn_key=tuple(seed_seq.spawn_key) + (attempt - 1,), pool_size=seed_seq.pool_size)
+
+@profiling.room_stage
+def _generate_attempts(gen, seed_seq):
+    '''
+    Room drawn from seed_seq. A rejected room is drawn again from the next child of seed_seq, up to gen.max_attempts times,
+    so each try depends only on seed_seq and the room is the same in any process.
+    '''
+    for attempt in range(gen.max_attempts):
+        gen.rng = np.random.default_rng(_attempt_seed(seed_seq, attempt))
+        try:
+            return gen.generate_new(max_attempts=1)
+        except RoomRejected:
+            if attempt + 1 >= gen.max_attempts:
+                raise
+
+def _generate_seeded(args):
+    '''
+    -> (room, room report of profiling or None)
+    '''
+    generator, seed_seq, profiled = args
+    gen = copy.copy(generator)
+    if not profiled:
+        return _generate_attempts(gen, seed_seq), None
+    with profiling.profile() as prof:
+        room = _generate_attempts(gen, seed_seq)
+    return room, prof.rooms[-1]
+
+def _generate_streamed(args):
+    '''
+    -> (room or (room, grid), room report of profiling or None)
+    '''
+    task, grid_kwargs = args
+    room, report = _generate_seeded(task)
+    if grid_kwargs is None:
+        return room, report
+    return (room, room.get_freespace_grid(**grid_kwargs)), report
+
+# grids of rasterize_rooms opened once per worker process
+_worker_grids = None
+
+def _open_grids(path, shape, offset):
+    global _worker_grids
+    _worker_grids = np.memmap(path, dtype=np.uint8, mode='r+', shape=shape, offset=offset)
+
+def _render_room(room, out, render_args):
+    space, xs, ys, origin_pos, origin_ori, pass_color, obs_color = render_args
+    space_poly = getattr(room, 'get_{}_poly'.format(space))()
+    with profiling.stage('rasterize'):
+        rasterize_into(out, space_poly, xs, ys, origin_pos, origin_ori, pass_color, obs_color)
+
+def _render_indexed(args):
+    '''
+    Render i-th room (a RoomConfig or a task of _generate_seeded) into the grids of worker -> room report of profiling or None
+    '''
+    i, item, render_args = args
+    report = None
+    if isinstance(item, tuple):
+        item, report = _generate_seeded(item)
+    _render_room(item, _worker_grids[i], render_args)
+    return report
+
+def allocate_grids(n, map_size=512, path=None):
+    '''
+    (n, map_size, map_size) uint8 array for rasterize_rooms, a np.memmap backed by the file at path if set.
+    '''
+    shape = (n, map_size, map_size)
+    if path is None:
+        return np.empty(shape, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode='w+', shape=shape)
+
+def rasterize_rooms(rooms, space='freespace', origin_pos=(0,0), origin_ori=0, resolution=0.05, map_size=512, pass_color=255, obs_color=0, out=None, workers=1, chunksize=None):
+    """rasterize_rooms
+
+    Function return occupancy grids of get_<space>_poly() of rooms rendered into one array.
+    Pixel axes are made once for all rooms. Workers open the array as a np.memmap and write their slices in place,
+    so only rooms are sent to them and nothing is sent back.
+
+    Args:
+        rooms (list): RoomConfig to render. rasterize_batch passes seeded tasks instead so that rooms are generated in workers.
+        space (str): Space rendered as passable, 'freespace' or 'freezone'.
+        origin_pos ((float,float)): Center of grids.
+        origin_ori (float): Yaw of grids.
+        resolution (float): Length of a pixel.
+        map_size (int): Pixel count of each side.
+        pass_color (int): Value of passable pixels.
+        obs_color (int): Value of other pixels.
+        out (ndarray): (len(rooms), map_size, map_size) uint8 array to write into, see allocate_grids.
+            Must be a np.memmap backed by a file if workers > 1. Allocated if None.
+        workers (int): Process count. In-process if <= 1, all cores if None.
+        chunksize (int): Rooms per task sent to a worker.
+
+    Returns:
+        ndarray: out, grid of room i at out[i] equal to get_occupancy_grid of it reshaped to (map_size, map_size).
+
+    """
+    n = len(rooms)
+    lin = get_grid_axis(resolution, map_size)
+    render_args = (space, lin, lin, tuple(origin_pos), origin_ori, pass_color, obs_color)
+    if workers is None:
+        from multiprocessing import cpu_count
+        workers = cpu_count()
+    workers = min(workers, n)
+
+    if workers <= 1:
+        out = allocate_grids(n, map_size) if out is None else out
+        assert out.shape == (n, map_size, map_size), 'out should be of shape (n, map_size, map_size)'
+        prof = profiling.current()
+        for i, item in enumerate(rooms):
+            if isinstance(item, tuple):
+                item, report = _generate_seeded(item)
+                if report is not None:
+                    prof.add_room(report)
+            _render_room(item, out[i], render_args)
+        return out
+
+    remove = None
+    if out is None:
+        import tempfile # loaded on first use, costly at startup
+        fd, remove = tempfile.mkstemp(suffix='.grids')
+        os.close(fd)
+        out = allocate_grids(n, map_size, remove)
+    if not (isinstance(out, np.memmap) and (out.filename is not None)):
+        raise ValueError('out should be a np.memmap backed by a file to be written by workers')
+    assert out.shape == (n, map_size, map_size), 'out should be of shape (n, map_size, map_size)'
+    out.flush()
+
+    if chunksize is None:
+        chunksize = max(1, n // (workers*4))
+    from multiprocessing import Pool
+    prof = profiling.current()
+    pool = Pool(workers, _open_grids, (out.filename, out.shape, out.offset))
+    try:
+        for report in pool.imap_unordered(_render_indexed, [(i, item, render_args) for i, item in enumerate(rooms)], chunksize):
+            if report is not None:
+                prof.add_room(report)
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
+        if remove is not None:
+            # mapping of out stays valid after the file is removed on POSIX
+            try:
+                os.remove(remove)
+            except OSError:
+                pass
+    return out
+
+class _StreamEnd(object):
+    def __init__(self, error=None):
+        self.error = error
+
+class RoomStream(object):
+    '''
+    Iterator of rooms generated ahead of consumption, created by RoomGeneratorFactory.stream.
+    At most prefetch rooms are waiting or in progress, so generation pauses while the consumer does.
+    Rooms still rejected after max_attempts tries are skipped and counted in skipped, other errors end the stream.
+    Supports "for room in stream", "async for room in stream" and "await stream.next_async()".
+    '''
+    poll_interval = 0.1
+
+    def __init__(self, generator, prefetch=4, workers=1, with_grid=None, seed=None):
+        assert prefetch >= 1, 'prefetch must be positive'
+        self.generator = generator
+        self.prefetch = prefetch
+        self.workers = workers
+        if (with_grid is None) or (with_grid is False):
+            self.grid_kwargs = None
+        else:
+            self.grid_kwargs = dict() if with_grid is True else dict(with_grid)
+        self.seed_seq = np.random.SeedSequence(seed)
+        self.profile = profiling.current()
+        self.closed = False
+        self.skipped = 0
+
+        self.pool = None
+        self.thread = None
+        if workers > 1:
+            from multiprocessing import Pool # loaded on first use, costly at startup
+            self.pool = Pool(workers)
+            self.pending = deque(self.pool.apply_async(_generate_streamed, (self._next_task(),)) for _ in range(prefetch))
+        else:
+            self.queue = queue.Queue(maxsize=prefetch)
+            self.stop_event = threading.Event()
+            self.thread = threading.Thread(target=self._produce)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def _next_task(self):
+        # spawning one child at a time gives the same seeds as generate_batch
+        task = (self.generator, self.seed_seq.spawn(1)[0], self.profile is not None)
+        return task, self.grid_kwargs
+
+    def _put(self, item):
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(item, timeout=self.poll_interval)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce(self):
+        try:
+            while True:
+                try:
+                    item = _generate_streamed(self._next_task())
+                except RoomRejected:
+                    self.skipped += 1
+                    continue
+                if not self._put(item):
+                    break
+        except Exception as e:
+            self._put(_StreamEnd(e))
+
+    def _take(self):
+        while self.pool is not None:
+            result = self.pending.popleft()
+            self.pending.append(self.pool.apply_async(_generate_streamed, (self._next_task(),)))
+            try:
+                return result.get()
+            except RoomRejected:
+                self.skipped += 1
+        while True:
+            try:
+                item = self.queue.get(timeout=self.poll_interval)
+                break
+            except queue.Empty:
+                if not self.thread.is_alive():
+                    raise RuntimeError('room stream producer stopped')
+        if isinstance(item, _StreamEnd):
+            raise item.error
+        return item
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.closed:
+            raise StopIteration
+        try:
+            item, report = self._take()
+        except Exception:
+            self.close()
+            raise
+        if report is not None:
+            self.profile.add_room(report)
+        return item
+
+    next = __next__ # python 2
+
+    def _next_or_stop_async(self):
+        try:
+            return self.__next__()
+        except StopIteration:
+            raise StopAsyncIteration
+
+    def next_async(self, loop=None):
+        '''
+        Awaitable of next item, waits in an executor thread so the event loop keeps running.
+        Called from a coroutine, the running loop is used if loop is None.
+        '''
+        import asyncio
+        loop = asyncio.get_running_loop() if loop is None else loop
+        return loop.run_in_executor(None, self._next_or_stop_async)
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        return self.next_async()
+
+    def close(self):
+        '''
+        Stop background generation and release workers. Rooms waiting in the queue are dropped.
+        '''
+        if self.closed:
+            return
+        self.closed = True
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pending.clear()
+        else:
+            self.stop_event.set()
+            self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        if getattr(self, 'closed', True) is False:
+            self.close()
 
 class RoomGeneratorFactory(object):
+    # rooms drawn by generate_new before RoomRejected reaches the caller
+    max_attempts = 100
+
     def __init__(self):
-        pass
+        # None: draw from global np.random state
+        self.rng = None
 
     @staticmethod
     def merge_config(base_instance, target_instance):
-        # target_instance.config.update(base_instance.config)
-        # target_instance.polygons.update(target_instance.polygons)
-        for tag, config in base_instance.config.items():
-            target_instance.config[tag] = config
-        for tag, polys in base_instance.polygons.items():
-            target_instance.polygons[tag] = polys
+        with profiling.stage('merge_config'):
+            for tag in base_instance.get_tags():
+                target_instance.invalidate(tag)
+                target_instance.layout.copy_tag(base_instance.layout, tag)
+                target_instance.invalidate(tag)
 
     @abc.abstractmethod
     def generate_new(self):
         pass
 
+    def reposition(self, room_conf):
+        '''
+        Move items of room_conf that can be moved without changing its layout, in place. Nothing for rooms without them.
+        '''
+        pass
+
+    def generate_variants(self, k, room_conf=None):
+        """generate_variants
+
+        Function return k variants of one layout. Each variant is a fork of the room with reposition applied,
+        so wall, obstacles and cached geometry of the layout are made once and shared.
+
+        Args:
+            k (int): Number of variants.
+            room_conf (RoomConfig): Room whose layout is used. A new room is generated if None.
+
+        Returns:
+            list: k RoomConfig. room_conf itself is not modified.
+
+        """
+        base = self.generate_new() if room_conf is None else room_conf
+        variants = []
+        for _ in range(k):
+            room = base.fork()
+            self.reposition(room)
+            variants.append(room)
+        return variants
+
+    def generate_batch(self, n, seed=None, workers=None, chunksize=None):
+        """generate_batch
+
+        Function yield n rooms in order. Room i is generated from i-th child of SeedSequence(seed),
+        so results for same seed are identical regardless of workers.
+        A rejected room (RoomRejected) is drawn again from the children of its own SeedSequence.
+        When a profile is active, room reports made in workers are merged into it.
+
+        Args:
+            n (int): Number of rooms.
+            seed (int, SeedSequence): Root seed. OS entropy is used if None.
+            workers (int): Process count. All cores if None, in-process if <= 1.
+            chunksize (int): Rooms per task sent to a worker.
+
+        Returns:
+            Iterator[RoomConfig]: Generated rooms.
+
+        """
+        seeds = np.random.SeedSequence(seed).spawn(n)
+        prof = profiling.current()
+        tasks = [(self, s, prof is not None) for s in seeds]
+        if workers is None:
+            from multiprocessing import cpu_count
+            workers = cpu_count()
+
+        if workers <= 1:
+            results = (_generate_seeded(t) for t in tasks)
+        else:
+            if chunksize is None:
+                chunksize = max(1, n // (workers*4))
+            from multiprocessing import Pool
+            pool = Pool(workers)
+            results = pool.imap(_generate_seeded, tasks, chunksize)
+
+        try:
+            for room, report in results:
+                if report is not None:
+                    prof.add_room(report)
+                yield room
+        finally:
+            if workers > 1:
+                pool.terminate()
+
+    def stream(self, prefetch=4, workers=1, with_grid=None, seed=None):
+        """stream
+
+        Function return endless iterator of rooms generated in background. Room i is generated from
+        i-th child of SeedSequence(seed) as in generate_batch.
+
+        Args:
+            prefetch (int): Max number of rooms generated ahead.
+            workers (int): Process count. A background thread is used if <= 1.
+            with_grid (bool, dict): Yield (room, room.get_freespace_grid(**with_grid)) if set, True for default args.
+            seed (int, SeedSequence): Root seed. OS entropy is used if None.
+
+        Returns:
+            RoomStream: Iterator, call close() or use as context manager to stop it.
+
+        """
+        return RoomStream(self, prefetch, workers, with_grid, seed)
+
+    def generate_cached(self, seed, cache, with_grid=None):
+        '''
+        Room of seed loaded from RoomCache (or cache directory path) cache, generated and stored on a miss.
+        '''
+        from .cache import RoomCache
+        if not isinstance(cache, RoomCache):
+            cache = RoomCache(cache)
+        return cache.generate(self, seed, with_grid)
+
+    def rasterize_batch(self, n, seed=None, workers=1, out=None, **grid_kwargs):
+        '''
+        Generate n rooms as generate_batch does and render them into one (n, map_size, map_size) array by rasterize_rooms.
+        Rooms are generated in the workers and only their grids are kept. grid_kwargs go to rasterize_rooms.
+        '''
+        prof = profiling.current()
+        tasks = [(self, s, prof is not None) for s in np.random.SeedSequence(seed).spawn(n)]
+        return rasterize_rooms(tasks, out=out, workers=workers, **grid_kwargs)
+
+class _RoomCaches(object):
+    __slots__ = ('unions', 'spaces', 'grids', 'indices', 'tilesets', 'segment_grids', 'nav_graphs')
+
+    def __init__(self):
+        # unions[tag] = unary_union of collision polygons of tag
+        self.unions = dict()
+        # spaces[key] = (geometry made from unions, tags it depends on or None for all tags)
+        self.spaces = dict()
+        # grids[(space, origin_pos, origin_ori, resolution, map_size)] = [mask, [bounds to re-render], {derived arrays}]
+        self.grids = OrderedDict()
+        # indices[(tag or None, collision or None)] = (PolygonIndex, [(tag, index)])
+        self.indices = dict()
+        # tilesets[space] = TiledOccupancy of get_<space>_poly()
+        self.tilesets = dict()
+        # segment_grids[tag or None] = SegmentGrid of edges of collision polygons
+        self.segment_grids = dict()
+        # nav_graphs[(space, clearance)] = NavGraph, kept while get_<space>_poly() stays the same geometry
+        self.nav_graphs = dict()
+
+    def fork(self):
+        '''
+        Caches holding immutable values are shared entry by entry, grids and tiles are rendered in place so they are not.
+        '''
+        other = _RoomCaches()
+        for name in ['unions', 'spaces', 'indices', 'segment_grids', 'nav_graphs']:
+            getattr(other, name).update(getattr(self, name))
+        return other
+
+def _read_only(arr):
+    view = arr.view()
+    view.flags.writeable = False
+    return view
+
 class RoomConfig(object):
+    '''
+    Components of a room stored in a RoomLayout. Derived geometry, grids, indices and tiles are cached
+    in a _RoomCaches made on first use.
+    '''
+    __slots__ = ('layout', '_caches')
+
+    conf_tag_collisions = 'collisions'
+    conf_tag_positions = 'positions'
+    conf_tag_baseshape = 'baseshape'
+
+    grid_cache_size = 8
+    tile_resolution = 0.05
+    tile_size = 64
+    tile_levels = 4
+    tile_cache_size = 512
+
     def __init__(self):
-        # config[tag] = {baseshape: Polygon, collisions: [bool], positions: [(x,y,yaw)]}
-        self.config = dict()
-        # polygons[tag] = [Polygon]
-        self.polygons = dict()
-
-        self.conf_tag_collisions = 'collisions'
-        self.conf_tag_positions = 'positions'
-        self.conf_tag_baseshape = 'baseshape'
+        self.layout = RoomLayout()
+        self._caches = None
+
+    def _get_caches(self):
+        if self._caches is None:
+            self._caches = _RoomCaches()
+        return self._caches
+
+    unions = property(lambda self: self._get_caches().unions)
+    spaces = property(lambda self: self._get_caches().spaces)
+    grids = property(lambda self: self._get_caches().grids)
+    indices = property(lambda self: self._get_caches().indices)
+    tilesets = property(lambda self: self._get_caches().tilesets)
+    segment_grids = property(lambda self: self._get_caches().segment_grids)
+    nav_graphs = property(lambda self: self._get_caches().nav_graphs)
+
+    def clear_caches(self):
+        self._caches = None
+
+    def fork(self):
+        '''
+        Copy of room that can be modified independently, e.g. by reposition_target.
+        Shapes, polygons and other attributes (obstacle_hulls, key_placing_area, ... in __slots__ or __dict__) are shared, not copied,
+        since they are replaced rather than modified. Only item arrays of layout are copied.
+        '''
+        with profiling.stage('fork'):
+            other = type(self).__new__(type(self))
+            for cls in type(self).__mro__:
+                for name in cls.__dict__.get('__slots__', ()):
+                    if (name not in ('layout', '_caches')) and hasattr(self, name):
+                        setattr(other, name, getattr(self, name))
+            if hasattr(self, '__dict__'):
+                # subclasses without __slots__
+                other.__dict__.update(self.__dict__)
+            other.layout = self.layout.copy()
+            other._caches = None if self._caches is None else self._caches.fork()
+        return other
+
+    @property
+    def config(self):
+        '''
+        {tag: {collisions, positions, baseshape}} view of layout.
+        note: arrays are read-only views, change them with set_config_* so that caches are invalidated.
+        Assigning a dict sets each of its tags by set_config_all, missing entries keep their current values.
+        '''
+        return dict((tag, {
+            self.conf_tag_collisions: self.get_collisions(tag),
+            self.conf_tag_positions: self.get_positions(tag),
+            self.conf_tag_baseshape: self.get_baseshape(tag),
+        }) for tag in self.layout.tags)
+
+    @config.setter
+    def config(self, config):
+        for tag, entry in config.items():
+            if tag not in self.layout:
+                self.register(tag, entry[self.conf_tag_baseshape], len(entry[self.conf_tag_collisions]))
+            current = self.config[tag]
+            current.update(entry)
+            self.set_config_all(tag, current[self.conf_tag_collisions], current[self.conf_tag_positions], current[self.conf_tag_baseshape])
+
+    @property
+    def polygons(self):
+        '''
+        {tag: polygons} of layout. Assigning a dict sets each of its tags by set_polygons_direct.
+        '''
+        return dict((tag, self.get_polygons(tag)) for tag in self.layout.tags)
+
+    @polygons.setter
+    def polygons(self, polygons):
+        for tag, polys in polygons.items():
+            self.set_polygons_direct(tag, polys)
     
     @abc.abstractmethod
     def prepare(self):
         pass
 
     def register(self, tag, base_shape, count):
-        self.config[tag] = {
-            self.conf_tag_collisions: np.ones([count], dtype=np.bool8),
-            self.conf_tag_positions: np.zeros([count,3]),
-            self.conf_tag_baseshape: base_shape,
-        }
-        self.polygons[tag] = np.empty([count], dtype=object)
+        self.layout.register(tag, base_shape, count)
+        self.clear_caches()
+
+    def get_tags(self):
+        return list(self.layout.tags)
+
+    def release_polygons(self):
+        '''
+        Drop polygons that set_polygons_auto made, they are made again on next access. Reduces memory of rooms kept in bulk.
+        '''
+        layout = self.layout
+        for i, tag in enumerate(layout.tags):
+            if layout.auto[i]:
+                layout.polygons[layout.span(tag)] = None
+
+    def invalidate(self, tag):
+        '''
+        Drop cached geometry made from tag, and mark areas of its current polygons to be re-rendered on cached grids and tiles.
+        '''
+        if self._caches is None:
+            return
+        self.unions.pop(tag, None)
+        for key, (_, tags) in list(self.spaces.items()):
+            if (tags is None) or (tag in tags):
+                del self.spaces[key]
+        for key in list(self.indices.keys()):
+            if key[0] in (None, tag):
+                del self.indices[key]
+        for key in list(self.segment_grids.keys()):
+            if key in (None, tag):
+                del self.segment_grids[key]
+        if (len(self.grids) == 0) and (len(self.tilesets) == 0):
+            return
+        polys = self.layout.polygons[self.layout.span(tag)] if tag in self.layout else []
+        bounds = [p.bounds for p in polys if (p is not None) and (not p.is_empty)]
+        for grid in self.grids.values():
+            grid[1].extend(bounds)
+        for tileset in self.tilesets.values():
+            tileset.invalidate_bounds(bounds)
+
+    def _fit(self, tag, count):
+        if self.layout.count(tag) != count:
+            self.invalidate(tag)
+            self.layout.resize(tag, count)
 
     def tweak_collision(self, tag, index, val=True):
-        self.config[tag][self.conf_tag_collisions][index] = val
+        self.layout.collisions[self.layout.span(tag)][index] = val
+        self.invalidate(tag)
     
     def set_config_collisions(self, tag, is_collision):
-        self.config[tag][self.conf_tag_collisions] = np.array(is_collision, dtype=np.bool8)
+        is_collision = np.asarray(is_collision, dtype=bool).reshape(-1)
+        self._fit(tag, len(is_collision))
+        self.layout.collisions[self.layout.span(tag)] = is_collision
+        self.invalidate(tag)
     
     def set_config_positions(self, tag, x_y_yaw):
-        self.config[tag][self.conf_tag_positions] = np.array(x_y_yaw)
+        x_y_yaw = np.asarray(x_y_yaw, dtype=float).reshape(-1,3)
+        self._fit(tag, len(x_y_yaw))
+        self.layout.poses[self.layout.span(tag)] = x_y_yaw
 
     def set_config_baseshape(self, tag, base_shape):
-        self.config[tag][self.conf_tag_baseshape] = base_shape
+        self.layout.set_shape(tag, base_shape)
 
     def set_config_all(self, tag, is_collision, x_y_yaw, base_shape):
         self.set_config_collisions(tag, is_collision)
@@ -73,26 +657,45 @@ class RoomConfig(object):
         self.set_config_positions(tag, x_y_yaw)
 
     def set_polygons_direct(self, tag, polygons):
-        self.polygons[tag] = polygons
+        self.invalidate(tag)
+        self._fit(tag, len(polygons))
+        layout = self.layout
+        layout.polygons[layout.span(tag)] = polygons
+        layout.auto[layout.tag_ids[tag]] = False
+        self.invalidate(tag)
+
+    def _moved_polygons(self, tag):
+        with profiling.stage('set_polygons_auto'):
+            return get_moved_polys_tf_rt(self.get_baseshape(tag), self.get_positions(tag))
 
     def set_polygons_auto(self, tag):
-        assert tag in self.config.keys(), 'not registered tag'
-        base_shape = self.config[tag][self.conf_tag_baseshape]
-        x_y_yaw = self.config[tag][self.conf_tag_positions]
-        polys = [get_moved_poly_tf_rt(base_shape, p[0], p[1], p[2]) for p in x_y_yaw]
-        self.set_polygons_direct(tag, polys)
+        assert tag in self.layout, 'not registered tag'
+        self.set_polygons_direct(tag, self._moved_polygons(tag))
+        self.layout.auto[self.layout.tag_ids[tag]] = True
 
     def get_collisions(self, component_tag):
-        return self.config[component_tag][self.conf_tag_collisions]
+        '''
+        -> (N,) bool, read-only view of layout. Change with set_config_collisions or tweak_collision.
+        '''
+        return _read_only(self.layout.collisions[self.layout.span(component_tag)])
 
     def get_positions(self, component_tag):
-        return self.config[component_tag][self.conf_tag_positions]
+        '''
+        -> (N,3) x, y, yaw, read-only view of layout. Change with set_config_positions.
+        note: views follow later changes of layout, copy them to keep the current values.
+        '''
+        return _read_only(self.layout.poses[self.layout.span(component_tag)])
 
     def get_baseshape(self, component_tag):
-        return self.config[component_tag][self.conf_tag_baseshape]
+        return self.layout.get_shape(component_tag)
 
     def get_polygons(self, component_tag):
-        return self.polygons[component_tag]
+        layout = self.layout
+        s = layout.span(component_tag)
+        polys = layout.polygons[s]
+        if layout.auto[layout.tag_ids[component_tag]] and (s.stop > s.start) and (polys[0] is None):
+            polys[:] = self._moved_polygons(component_tag) # released by release_polygons
+        return polys
 
     def gather_polygon_from_config(self, conf_filter=None):
         '''
@@ -101,65 +704,191 @@ class RoomConfig(object):
         l = []
         for tag, config in self.config.items():
             if conf_filter is None:
-                l.extend(self.polygons[tag])
+                l.extend(self.get_polygons(tag))
             else:
-                polys = [p for i,p in enumerate(self.polygons[tag]) if conf_filter(tag, config, i)]
+                polys = [p for i,p in enumerate(self.get_polygons(tag)) if conf_filter(tag, config, i)]
                 l.extend(polys)
         return l
 
     def get_inner_poly(self, exterior_tag, holes=[], exterior_index=0):
-        exte_pol = self.polygons[exterior_tag][exterior_index]
+        exte_pol = self.get_polygons(exterior_tag)[exterior_index]
         assert len(exte_pol.interiors) == 1, 'exterior_tag should be perforated shape'
         inte_pol = Polygon(exte_pol.interiors[0])
         if isinstance(holes, Polygon):
             h = [holes.exterior.coords]
-        elif isinstance(holes, MultiPolygon):
+        elif isinstance(holes, (MultiPolygon, GeometryCollection)):
             h = [p.exterior.coords for p in holes.geoms]
         else:
             h = [p.exterior.coords for p in holes]
         return Polygon(inte_pol.exterior.coords, h)
 
+    def get_collision_union(self, tag):
+        if tag not in self.unions:
+            self.unions[tag] = unary_union(self.get_collision_poly_focus(tag))
+        return self.unions[tag]
+
+    def get_cached_space(self, key, create, tags=None):
+        '''
+        note: cache is dropped when any of tags is invalidated (any tag if tags is None).
+        '''
+        if key not in self.spaces:
+            with profiling.stage('space.{}'.format(key if isinstance(key, str) else key[1])) as s:
+                self.spaces[key] = (s.geometry(create()), tags)
+        return self.spaces[key][0]
+
     def get_space_poly(self, exterior_tag, poly_index=0):
-        conf_filter = lambda tag, conf, i: (conf[self.conf_tag_collisions][i]) and (tag != exterior_tag)
-        polys = unary_union(self.gather_polygon_from_config(conf_filter))
-        return self.get_inner_poly(exterior_tag, polys, poly_index)
+        def create():
+            polys = unary_union([self.get_collision_union(tag) for tag in self.layout.tags if tag != exterior_tag])
+            return self.get_inner_poly(exterior_tag, polys, poly_index)
+        return self.get_cached_space(('space', exterior_tag, poly_index), create)
 
     def get_collision_poly(self):
-        conf_filter = lambda tag, conf, i: conf[self.conf_tag_collisions][i]
-        polys = self.gather_polygon_from_config(conf_filter)
-        return unary_union(polys)
+        return self.get_cached_space('collision', lambda: unary_union([self.get_collision_union(tag) for tag in self.layout.tags]))
 
     def get_collision_poly_focus(self, tag):
-        return [self.polygons[tag][i] for i in range(len(self.polygons[tag])) if self.config[tag][self.conf_tag_collisions][i]]
+        return list(self.get_polygons(tag)[self.get_collisions(tag)])
+
+    def get_polygon_index(self, tag=None, collision=None):
+        '''
+        note: tag=None indexes all tags, collision=True/False indexes only polygons with that collision flag.
+        '''
+        key = (tag, collision)
+        if key not in self.indices:
+            tags = self.layout.tags if tag is None else [tag]
+            refs = [(t, i) for t in tags for i in range(self.layout.count(t)) if (collision is None) or (bool(self.get_collisions(t)[i]) == collision)]
+            self.indices[key] = (PolygonIndex([self.get_polygons(t)[i] for t, i in refs]), refs)
+        return self.indices[key]
+
+    def query_point(self, x, y, tag=None, collision=None):
+        index, refs = self.get_polygon_index(tag, collision)
+        return [refs[i] for i in index.query_point(x, y)]
+
+    def query_radius(self, x, y, radius, tag=None, collision=None):
+        index, refs = self.get_polygon_index(tag, collision)
+        return [refs[i] for i in index.query_radius(x, y, radius)]
+
+    def nearest(self, x, y, tag=None, collision=None):
+        '''
+        -> (tag, index, distance), None if no polygon
+        '''
+        index, refs = self.get_polygon_index(tag, collision)
+        i, dist = index.nearest(x, y)
+        if i < 0:
+            return None
+        return refs[i][0], refs[i][1], dist
+
+    def get_segment_grid(self, tag=None):
+        '''
+        note: tag=None uses collision polygons of all tags. Kept until collisions or polygons of the tags change.
+        '''
+        if tag not in self.segment_grids:
+            tags = self.layout.tags if tag is None else [tag]
+            with profiling.stage('segment_grid'):
+                p0, p1 = polygon_segments([p for t in tags for p in self.get_collision_poly_focus(t)])
+                self.segment_grids[tag] = SegmentGrid(p0, p1)
+        return self.segment_grids[tag]
+
+    def simulate_scan(self, x, y, yaw, n_beams=360, max_range=10.0, fov=2*np.pi, tag=None):
+        """simulate_scan
+
+        Function return ranges of a simulated 2D laser scanner against collision polygons.
+        Poses can be arrays to scan from many poses at once.
+
+        Args:
+            x (float or ndarray): X of scanner poses.
+            y (float or ndarray): Y of scanner poses, broadcast with x and yaw.
+            yaw (float or ndarray): Heading of scanner poses [rad].
+            n_beams (int): Number of beams, spread over yaw + [-fov/2, fov/2].
+            max_range (float): Range returned by beams that hit nothing.
+            fov (float): Angle covered by beams [rad]. With a full turn the first beam points backward.
+            tag (str): Scan only collision polygons of tag. All tags if None.
+
+        Returns:
+            ndarray: (*pose shape, n_beams) ranges.
+
+        """
+        grid = self.get_segment_grid(tag)
+        with profiling.stage('simulate_scan'):
+            return grid.cast(x, y, yaw, n_beams, max_range, fov)
 
     @abc.abstractmethod
     def get_freespace_poly(self):
         pass
 
+    def get_space_entry(self, space, origin_pos=(0,0), origin_ori=0, resolution=0.05, map_size=512):
+        '''
+        Cached [mask, dirty, derived] of get_<space>_poly(). After tags changed, only the areas of changed polygons are re-rendered
+        and arrays derived from the mask are dropped.
+        '''
+        lin = get_grid_axis(resolution, map_size)
+        key = (space, tuple(origin_pos), origin_ori, resolution, map_size)
+        if key in self.grids:
+            self.grids[key] = self.grids.pop(key)
+        else:
+            space_poly = getattr(self, 'get_{}_poly'.format(space))()
+            with profiling.stage('rasterize'):
+                self.grids[key] = [polygon_mask(space_poly, lin, lin, origin_pos, origin_ori), [], dict()]
+            while len(self.grids) > self.grid_cache_size:
+                self.grids.popitem(last=False)
+        entry = self.grids[key]
+        mask, dirty, derived = entry
+        if len(dirty) > 0:
+            space_poly = getattr(self, 'get_{}_poly'.format(space))()
+            with profiling.stage('rasterize_update'):
+                update_mask(mask, space_poly, lin, lin, dirty, origin_pos, origin_ori)
+            del dirty[:]
+            derived.clear()
+        return entry
+
+    def get_space_grid(self, space, origin_pos=(0,0), origin_ori=0, resolution=0.05, map_size=512, pass_color=255, obs_color=0):
+        mask, _, _ = self.get_space_entry(space, origin_pos, origin_ori, resolution, map_size)
+        return colorize(mask, pass_color, obs_color)
+
+    def get_tiles(self, space='freespace'):
+        if space not in self.tilesets:
+            get_poly = getattr(self, 'get_{}_poly'.format(space))
+            self.tilesets[space] = TiledOccupancy(get_poly, self.tile_resolution, self.tile_size, self.tile_levels, self.tile_cache_size)
+        return self.tilesets[space]
+
+    def get_local_grid(self, origin_pos=(0,0), origin_ori=0, resolution=0.05, map_size=512, pass_color=255, obs_color=0, space='freespace'):
+        '''
+        Occupancy grid around origin assembled from lazily rendered tiles, cheap for windows moving every step.
+        note: pixels take the nearest tile pixel, so edges may differ from get_occupancy_grid by a tile pixel.
+        '''
+        return self.get_tiles(space).get_crop_grid(origin_pos, origin_ori, resolution, map_size, pass_color, obs_color)
+
+    def get_distance_field(self, origin_pos=(0,0), origin_ori=0, resolution=0.05, map_size=512, space='freespace'):
+        '''
+        Flatten distance [m] from each pixel center of the occupancy grid to nearest obstacle pixel center.
+        note: returned array is cached and read-only.
+        '''
+        mask, _, derived = self.get_space_entry(space, origin_pos, origin_ori, resolution, map_size)
+        if 'distance' not in derived:
+            lin = get_grid_axis(resolution, map_size)
+            spacing = lin[1] - lin[0] if map_size > 1 else resolution
+            distance = (distance_transform(mask) * spacing).ravel()
+            distance.flags.writeable = False
+            derived['distance'] = distance
+        return derived['distance']
+
+    def get_costmap(self, inflation_radius, origin_pos=(0,0), origin_ori=0, resolution=0.05, map_size=512, inscribed_radius=0.0, cost_scaling=10.0, space='freespace'):
+        '''
+        Flatten inflated costmap made from get_distance_field.
+        note: returned array is cached and read-only.
+        '''
+        _, _, derived = self.get_space_entry(space, origin_pos, origin_ori, resolution, map_size)
+        key = ('costmap', inflation_radius, inscribed_radius, cost_scaling)
+        if key not in derived:
+            distance = self.get_distance_field(origin_pos, origin_ori, resolution, map_size, space)
+            cost = inflate(distance, inflation_radius, inscribed_radius, cost_scaling)
+            cost.flags.writeable = False
+            derived[key] = cost
+        return derived[key]
+
+    def get_freespace_grid(self, origin_pos=(0,0), origin_ori=0, resolution=0.05, map_size=512, pass_color=255, obs_color=0):
+        return self.get_space_grid('freespace', origin_pos, origin_ori, resolution, map_size, pass_color, obs_color)
+
     @abc.abstractmethod
     def get_occupancy_grid(self, space_poly, origin_pos=(0,0), origin_ori=0, resolution=0.05, map_size=512, pass_color=255, obs_color=0):
-        if (origin_pos[0] == 0) and (origin_pos[1] == 0) and (origin_ori == 0):
-            corrected = space_poly
-        else:
-            corrected = get_moved_poly_rt_tf(space_poly, -origin_pos[0], -origin_pos[1], -origin_ori)
-    
-        half_length = (map_size * resolution) / 2
-        lin = np.linspace(-half_length, half_length, map_size)
-        xx, yy = np.meshgrid(lin, lin)
-        xc = xx.flatten()
-        yc = yy.flatten()
-        
-        data = np.full([map_size*map_size], obs_color, dtype=np.uint8)
-
-        xl = Array('d', xc)
-        yl = Array('d', yc)
-        
-        global mu
-
-        def mu(i):
-            return corrected.contains(Point(xl[i], yl[i]))
-
-        with closing(Pool()) as pool:
-            data[pool.map(mu, range(len(xc)))] = pass_color
-    
-        return data
\ No newline at end of file
+        with profiling.stage('rasterize'):
+            return rasterize(space_poly, origin_pos, origin_ori, resolution, map_size, pass_color, obs_color)
\ No newline at end of file
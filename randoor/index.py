@@ -0,0 +1,71 @@
+import numpy as np
+from shapely.geometry import Point
+
+try:
+    from shapely import STRtree, points as shapely_points
+except ImportError: # shapely < 2.0
+    STRtree = None
+
+class PolygonIndex(object):
+    '''
+    Spatial index over polygons. Queries return positions in polys.
+    STRtree is used on shapely >= 2.0, a scan over bounds arrays otherwise.
+    '''
+    def __init__(self, polys):
+        self.polys = np.empty([len(polys)], dtype=object)
+        self.polys[:] = list(polys)
+        self.bounds = np.array([p.bounds for p in self.polys]).reshape(-1,4)
+        self.tree = STRtree(self.polys) if (STRtree is not None) and (len(self.polys) > 0) else None
+
+    def __len__(self):
+        return len(self.polys)
+
+    def _candidates(self, x, y, radius=0):
+        b = self.bounds
+        return np.nonzero((b[:,0]-radius <= x) & (x <= b[:,2]+radius) & (b[:,1]-radius <= y) & (y <= b[:,3]+radius))[0]
+
+    def query_point(self, x, y):
+        if len(self) == 0:
+            return np.empty([0], dtype=int)
+        if self.tree is not None:
+            return np.sort(self.tree.query(shapely_points(x, y), predicate='intersects'))
+        pt = Point(x, y)
+        return np.array([i for i in self._candidates(x, y) if self.polys[i].intersects(pt)], dtype=int)
+
+    def query_radius(self, x, y, radius):
+        if len(self) == 0:
+            return np.empty([0], dtype=int)
+        if self.tree is not None:
+            return np.sort(self.tree.query(shapely_points(x, y), predicate='dwithin', distance=radius))
+        pt = Point(x, y)
+        return np.array([i for i in self._candidates(x, y, radius) if self.polys[i].distance(pt) <= radius], dtype=int)
+
+    def nearest(self, x, y):
+        '''
+        -> (position, distance), (-1, inf) if empty
+        '''
+        if len(self) == 0:
+            return -1, np.inf
+        if self.tree is not None:
+            idx, dist = self.tree.query_nearest(shapely_points(x, y), return_distance=True)
+            return int(idx[0]), float(dist[0])
+        pt = Point(x, y)
+        dist = np.array([p.distance(pt) for p in self.polys])
+        return int(np.argmin(dist)), float(dist.min())
+
+    def hit_any(self, xs, ys):
+        '''
+        Whether each point touches any polygon.
+        '''
+        xs, ys = np.broadcast_arrays(np.asarray(xs, dtype=float), np.asarray(ys, dtype=float))
+        hit = np.zeros(xs.shape, dtype=bool)
+        if len(self) == 0:
+            return hit
+        if self.tree is not None:
+            pairs = self.tree.query(shapely_points(xs.ravel(), ys.ravel()), predicate='intersects')
+            hit.ravel()[pairs[0]] = True
+            return hit
+        flat = hit.ravel()
+        for i, (x, y) in enumerate(zip(xs.ravel(), ys.ravel())):
+            flat[i] = len(self.query_point(x, y)) > 0
+        return hit
@@ -0,0 +1,124 @@
+import numpy as np
+
+class RoomLayout(object):
+    '''
+    Struct-of-arrays storage of room components. Items of a tag are contiguous, so arrays of a tag are views
+    of the item arrays: collisions (N,), poses (N,3) and polygons (N,). Base shapes are shared by shape id.
+    '''
+    __slots__ = ('tags', 'tag_ids', 'offsets', 'shapes', 'shape_ids', 'auto', 'collisions', 'poses', 'polygons')
+
+    def __init__(self):
+        self.tags = []
+        self.tag_ids = dict()
+        self.offsets = np.zeros([1], dtype=np.int64)
+        self.shapes = []
+        self.shape_ids = np.empty([0], dtype=np.int32)
+        # auto[tag id]: polygons are base shape moved to poses, so they can be dropped and made again
+        self.auto = np.empty([0], dtype=bool)
+        self.collisions = np.empty([0], dtype=bool)
+        self.poses = np.empty([0,3])
+        self.polygons = np.empty([0], dtype=object)
+
+    def copy(self):
+        '''
+        Layout with own item arrays. Base shapes and polygons are shared, they are never modified in place.
+        '''
+        other = RoomLayout.__new__(RoomLayout)
+        other.tags = list(self.tags)
+        other.tag_ids = dict(self.tag_ids)
+        other.offsets = self.offsets.copy()
+        other.shapes = list(self.shapes)
+        other.shape_ids = self.shape_ids.copy()
+        other.auto = self.auto.copy()
+        other.collisions = self.collisions.copy()
+        other.poses = self.poses.copy()
+        other.polygons = self.polygons.copy()
+        return other
+
+    def __contains__(self, tag):
+        return tag in self.tag_ids
+
+    def __len__(self):
+        return len(self.collisions)
+
+    def span(self, tag):
+        i = self.tag_ids[tag]
+        return slice(int(self.offsets[i]), int(self.offsets[i+1]))
+
+    def count(self, tag):
+        i = self.tag_ids[tag]
+        return int(self.offsets[i+1] - self.offsets[i])
+
+    def item_tags(self):
+        '''
+        (N,) tag id of each item.
+        '''
+        return np.repeat(np.arange(len(self.tags)), np.diff(self.offsets))
+
+    def shape_id(self, shape):
+        for i, s in enumerate(self.shapes):
+            if s is shape:
+                return i
+        self.shapes.append(shape)
+        return len(self.shapes)-1
+
+    def set_shape(self, tag, shape):
+        self.shape_ids[self.tag_ids[tag]] = self.shape_id(shape)
+
+    def get_shape(self, tag):
+        return self.shapes[self.shape_ids[self.tag_ids[tag]]]
+
+    def register(self, tag, shape, count):
+        '''
+        Add tag with count items of collision True at origin, or reset it if registered.
+        '''
+        if tag not in self.tag_ids:
+            self.tag_ids[tag] = len(self.tags)
+            self.tags.append(tag)
+            self.offsets = np.append(self.offsets, self.offsets[-1])
+            self.shape_ids = np.append(self.shape_ids, np.int32(0))
+            self.auto = np.append(self.auto, False)
+        self.resize(tag, count)
+        self.collisions[self.span(tag)] = True
+        self.poses[self.span(tag)] = 0
+        self.polygons[self.span(tag)] = None
+        self.auto[self.tag_ids[tag]] = False
+        self.set_shape(tag, shape)
+
+    def resize(self, tag, count):
+        '''
+        Change item count of tag, items of other tags are kept.
+        '''
+        i = self.tag_ids[tag]
+        s = self.span(tag)
+        old = s.stop - s.start
+        if old == count:
+            return
+        keep = min(old, count)
+        grow = count - keep
+
+        def splice(a, fill):
+            pad = np.empty((grow,) + a.shape[1:], dtype=a.dtype)
+            pad[...] = fill
+            return np.concatenate([a[:s.start+keep], pad, a[s.stop:]])
+
+        self.collisions = splice(self.collisions, True)
+        self.poses = splice(self.poses, 0)
+        self.polygons = splice(self.polygons, None)
+        self.offsets[i+1:] += count - old
+
+    def copy_tag(self, other, tag):
+        '''
+        Copy items and shape of tag from other layout.
+        '''
+        s = other.span(tag)
+        if tag not in self.tag_ids:
+            self.register(tag, other.get_shape(tag), s.stop - s.start)
+        else:
+            self.resize(tag, s.stop - s.start)
+            self.set_shape(tag, other.get_shape(tag))
+        d = self.span(tag)
+        self.collisions[d] = other.collisions[s]
+        self.poses[d] = other.poses[s]
+        self.polygons[d] = other.polygons[s]
+        self.auto[self.tag_ids[tag]] = other.auto[other.tag_ids[tag]]
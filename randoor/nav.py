@@ -0,0 +1,257 @@
+import heapq
+
+import numpy as np
+from shapely.geometry import Point
+from shapely.geometry.polygon import orient
+
+try:
+    from shapely import points as shapely_points, distance as shapely_distance, intersects_xy
+except ImportError: # shapely < 2.0
+    shapely_points = None
+    from shapely.vectorized import touches as _touches_xy, contains as _contains_xy
+    intersects_xy = lambda geom, x, y: _contains_xy(geom, x, y) | _touches_xy(geom, x, y)
+
+def _cross(u, v):
+    return u[...,0]*v[...,1] - u[...,1]*v[...,0]
+
+def _in_cone(d, prev, next):
+    '''
+    Whether directions d point into the closed interior cone of vertices, interior being left of prev -> vertex -> next.
+    '''
+    e0, e1 = prev, next # from vertex to its neighbours
+    convex = _cross(e1, e0) > 0
+    inside_convex = (_cross(e1, d) >= 0) & (_cross(d, e0) >= 0)
+    outside_reflex = (_cross(e0, d) > 0) & (_cross(d, e1) > 0)
+    return np.where(convex, inside_convex, ~outside_reflex)
+
+class NavGraph(object):
+    '''
+    Visibility graph over reflex vertices of a space polygon, searched by Dijkstra from query points.
+    Shortest paths inside a polygon bend only at reflex vertices, so point queries connect to the graph by visibility.
+    Polygon parts are the connected components, the graph is built on first distance or path query.
+    '''
+    def __init__(self, space_poly, max_pairs=2**21):
+        self.space_poly = space_poly
+        self.max_pairs = max_pairs
+        self.parts = [orient(p, 1.0) for p in getattr(space_poly, 'geoms', [space_poly]) if not p.is_empty]
+
+        # rings with interior on the left
+        rings = [np.asarray(r.coords)[:-1,:2] for p in self.parts for r in [p.exterior] + list(p.interiors)]
+        ring_part = [i for i, p in enumerate(self.parts) for _ in range(1 + len(p.interiors))]
+        rings = [(r, i) for r, i in zip(rings, ring_part) if len(r) >= 3]
+        if len(rings) > 0:
+            self.vertices = np.concatenate([r for r, _ in rings])
+            self.prev = np.concatenate([np.roll(r, 1, axis=0) - r for r, _ in rings])
+            self.next = np.concatenate([np.roll(r, -1, axis=0) - r for r, _ in rings])
+            self.vertex_part = np.concatenate([np.full([len(r)], i) for r, i in rings])
+        else:
+            self.vertices, self.prev, self.next = np.empty([0,2]), np.empty([0,2]), np.empty([0,2])
+            self.vertex_part = np.empty([0], dtype=int)
+        self.edge_p0 = self.vertices
+        extent = np.ptp(self.vertices, axis=0).max() if len(self.vertices) > 0 else 1.0
+        self.eps = 1e-9 * max(extent, 1.0)
+
+        reflex = _cross(self.next, self.prev) < 0
+        self.node_ids = np.nonzero(reflex)[0]
+        self.nodes = self.vertices[self.node_ids]
+        self.node_part = self.vertex_part[self.node_ids]
+        # visible neighbours of node i are indices[indptr[i]:indptr[i+1]] at lengths weights[...]
+        self.indptr = None
+        self.indices = None
+        self.weights = None
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _segments_clear(self, p, q, p_node=None, q_node=None):
+        '''
+        Whether segments p -> q (k,2) stay in the closed space. p_node/q_node are vertex ids of endpoints or -1.
+        '''
+        d = q - p
+        length = np.hypot(d[:,0], d[:,1])
+        ok = np.ones([len(p)], dtype=bool)
+        for ends, sign in [(p_node, 1), (q_node, -1)]:
+            if ends is None:
+                continue
+            at = ends >= 0
+            ok[at] &= _in_cone(sign * d[at], self.prev[ends[at]], self.next[ends[at]])
+
+        chunk = max(int(self.max_pairs // max(len(self.vertices), 1)), 1)
+        for s in range(0, len(p), chunk):
+            sl = slice(s, s+chunk)
+            idx = np.nonzero(ok[sl])[0] + s
+            if len(idx) == 0:
+                continue
+            px, py = p[idx,0,np.newaxis], p[idx,1,np.newaxis]
+            dx, dy = d[idx,0,np.newaxis], d[idx,1,np.newaxis]
+            ll = length[idx,np.newaxis]
+            tol = self.eps * np.maximum(ll, self.eps)
+            # vectors from segment starts to edge starts (k,E)
+            ax, ay = self.edge_p0[:,0] - px, self.edge_p0[:,1] - py
+            ex, ey = self.next[:,0], self.next[:,1]
+            # proper crossings of boundary edges
+            o1 = dx*ay - dy*ax
+            o2 = o1 + dx*ey - dy*ex
+            o3 = ey*ax - ex*ay
+            o4 = o3 + ex*dy - ey*dx
+            crossing = (((o1 > tol) & (o2 < -tol)) | ((o1 < -tol) & (o2 > tol))) & \
+                (((o3 > tol) & (o4 < -tol)) | ((o3 < -tol) & (o4 > tol)))
+            blocked = crossing.any(axis=1)
+            # passing through a vertex is allowed only inside its cone in both directions
+            t = (ax*dx + ay*dy) / np.maximum(ll*ll, self.eps)
+            on = (np.abs(o1) <= tol) & (t > self.eps) & (t < 1 - self.eps)
+            k, v = np.nonzero(on)
+            if len(k) > 0:
+                dk = d[idx[k]]
+                through = _in_cone(dk, self.prev[v], self.next[v]) & _in_cone(-dk, self.prev[v], self.next[v])
+                blocked[k[~through]] = True
+            ok[idx] = ~blocked
+
+        # ends that are not vertices have no cone, segments leaving the space right there are caught at their middle
+        check = ok.copy()
+        if (p_node is not None) and (q_node is not None):
+            check &= (p_node < 0) | (q_node < 0)
+        if check.any():
+            mid = (p[check] + q[check]) / 2
+            ok[check] = intersects_xy(self.space_poly, mid[:,0], mid[:,1])
+        return ok
+
+    def _build(self):
+        if self.indptr is not None:
+            return
+        n = len(self.nodes)
+        i, j = np.triu_indices(n, 1)
+        same = self.node_part[i] == self.node_part[j]
+        i, j = i[same], j[same]
+        clear = self._segments_clear(self.nodes[i], self.nodes[j], self.node_ids[i], self.node_ids[j])
+        i, j = i[clear], j[clear]
+        w = np.hypot(*(self.nodes[j] - self.nodes[i]).T)
+
+        # both directions of each edge, grouped by source node
+        src, dst = np.concatenate([i, j]), np.concatenate([j, i])
+        order = np.argsort(src, kind='stable')
+        self.indices = dst[order]
+        self.weights = np.concatenate([w, w])[order]
+        self.indptr = np.searchsorted(src[order], np.arange(n+1))
+
+    def _dijkstra(self, cost):
+        '''
+        (N,) straight costs from a source point to visible nodes -> ((N,) shortest lengths to every node,
+        (N,) previous node on each shortest path, -1 for nodes reached straight from the source).
+        '''
+        dist = np.array(cost, dtype=float)
+        prev = np.full([len(dist)], -1)
+        done = np.zeros([len(dist)], dtype=bool)
+        heap = [(d, i) for i, d in enumerate(dist.tolist()) if d < np.inf]
+        heapq.heapify(heap)
+        while heap:
+            d, i = heapq.heappop(heap)
+            if done[i]:
+                continue
+            done[i] = True
+            nbr = self.indices[self.indptr[i]:self.indptr[i+1]]
+            via = d + self.weights[self.indptr[i]:self.indptr[i+1]]
+            shorter = via < dist[nbr]
+            nbr, via = nbr[shorter], via[shorter]
+            dist[nbr] = via
+            prev[nbr] = i
+            for item in zip(via.tolist(), nbr.tolist()):
+                heapq.heappush(heap, item)
+        return dist, prev
+
+    def _point_costs(self, points):
+        '''
+        (M,N) straight distances from points to visible nodes, inf if not visible or point is outside.
+        '''
+        m, n = len(points), len(self.nodes)
+        cost = np.full([m, n], np.inf)
+        inside = self.contains(points)
+        pi, ni = np.nonzero(inside[:,np.newaxis] & (self.node_part[np.newaxis] == self.component_of(points)[:,np.newaxis]))
+        if len(pi) == 0:
+            return cost
+        p, q = points[pi], self.nodes[ni]
+        clear = self._segments_clear(p, q, np.full([len(pi)], -1), self.node_ids[ni])
+        cost[pi[clear], ni[clear]] = np.hypot(*(q[clear] - p[clear]).T)
+        return cost
+
+    def contains(self, points):
+        points = np.asarray(points, dtype=float).reshape(-1,2)
+        if self.space_poly.is_empty:
+            return np.zeros([len(points)], dtype=bool)
+        return np.asarray(intersects_xy(self.space_poly, points[:,0], points[:,1]), dtype=bool)
+
+    def component_of(self, points, tolerance=0.0):
+        '''
+        Part index of space polygon containing each point (within tolerance), -1 if none.
+        '''
+        points = np.asarray(points, dtype=float).reshape(-1,2)
+        labels = np.full([len(points)], -1)
+        for i, part in reversed(list(enumerate(self.parts))):
+            if shapely_points is not None:
+                d = shapely_distance(part, shapely_points(points))
+            else:
+                d = np.array([part.distance(Point(x, y)) for x, y in points])
+            labels[d <= tolerance] = i
+        return labels
+
+    def geodesic_distance(self, points_a, points_b):
+        """geodesic_distance
+
+        Function return shortest path lengths inside space polygon between all pairs of points.
+
+        Args:
+            points_a (ndarray): (M,2) points.
+            points_b (ndarray): (K,2) points.
+
+        Returns:
+            ndarray: (M,K) lengths, inf if not connected or a point is outside.
+
+        """
+        a = np.asarray(points_a, dtype=float).reshape(-1,2)
+        b = np.asarray(points_b, dtype=float).reshape(-1,2)
+        result = self._direct(a, b)
+        if len(self.nodes) > 0:
+            self._build()
+            # lengths are symmetric, search from the side with fewer points
+            swap = len(b) < len(a)
+            sources, targets = (b, a) if swap else (a, b)
+            cost_t = self._point_costs(targets)
+            via = np.empty([len(sources), len(targets)])
+            for s, cost in enumerate(self._point_costs(sources)):
+                dist, _ = self._dijkstra(cost)
+                via[s] = np.min(cost_t + dist, axis=1)
+            result = np.minimum(result, via.T if swap else via)
+        return result
+
+    def _direct(self, a, b):
+        ai, bi = np.meshgrid(np.arange(len(a)), np.arange(len(b)), indexing='ij')
+        ai, bi = ai.ravel(), bi.ravel()
+        result = np.full([len(a), len(b)], np.inf)
+        inside_a, inside_b = self.contains(a), self.contains(b)
+        keep = inside_a[ai] & inside_b[bi]
+        ai, bi = ai[keep], bi[keep]
+        clear = self._segments_clear(a[ai], b[bi])
+        result[ai[clear], bi[clear]] = np.hypot(*(b[bi[clear]] - a[ai[clear]]).T)
+        return result
+
+    def path(self, start, goal):
+        '''
+        -> (L,2) shortest path from start to goal through reflex vertices, None if not connected.
+        '''
+        start = np.asarray(start, dtype=float).reshape(1,2)
+        goal = np.asarray(goal, dtype=float).reshape(1,2)
+        direct = self._direct(start, goal)[0,0]
+        best, route = direct, []
+        if len(self.nodes) > 0:
+            self._build()
+            dist, prev = self._dijkstra(self._point_costs(start)[0])
+            total = dist + self._point_costs(goal)[0]
+            j = np.argmin(total)
+            if total[j] < best:
+                best, route = total[j], [j]
+                while prev[route[-1]] >= 0:
+                    route.append(prev[route[-1]])
+                route.reverse()
+        if not np.isfinite(best):
+            return None
+        return np.concatenate([start, self.nodes[np.array(route, dtype=int)].reshape(-1,2), goal])
@@ -0,0 +1,195 @@
+'''
+Opt-in instrumentation of room generation. Nothing is recorded unless a profile is active.
+
+    with profile() as prof:
+        rooms = [generator.generate_new() for _ in range(100)]
+    print(prof.format())   # aggregated over the 100 rooms
+    prof.rooms[0]          # report of the first room
+'''
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+from .raster import get_rings
+
+try:
+    from shapely import get_num_coordinates
+except ImportError: # shapely < 2.0
+    get_num_coordinates = None
+
+class _ActiveStack(threading.local):
+    def __init__(self):
+        self.profiles = []
+
+# per-thread stack of active Profile, records go to the innermost one
+_active = _ActiveStack()
+
+def count_vertices(geoms):
+    '''
+    Total coordinate count of a geometry or an iterable of geometries.
+    '''
+    if hasattr(geoms, 'geom_type'):
+        geoms = [geoms]
+    if get_num_coordinates is not None:
+        return int(sum(get_num_coordinates(list(geoms))))
+    return sum(len(r) for g in geoms for ext, ints in get_rings(g) for r in [ext] + ints)
+
+def _new_report():
+    return dict(stages=OrderedDict(), counters=OrderedDict())
+
+def _add_stage(report, name, calls, seconds, vertices):
+    s = report['stages'].setdefault(name, dict(calls=0, seconds=0.0, vertices=0))
+    s['calls'] += calls
+    s['seconds'] += seconds
+    s['vertices'] += vertices
+
+def _add_count(report, name, n):
+    report['counters'][name] = report['counters'].get(name, 0) + n
+
+class Profile(object):
+    '''
+    Stage timings and counters. Each outermost generate_new call adds a report to rooms,
+    totals accumulate everything recorded while the profile is active.
+    '''
+    def __init__(self):
+        self.rooms = []
+        self.totals = _new_report()
+        self._room = None
+        self._depth = 0
+
+    def _targets(self):
+        return [self.totals] if self._room is None else [self.totals, self._room]
+
+    def add_stage(self, name, seconds, vertices=0):
+        for r in self._targets():
+            _add_stage(r, name, 1, seconds, vertices)
+
+    def add_count(self, name, n=1):
+        for r in self._targets():
+            _add_count(r, name, n)
+
+    def add_room(self, room_report):
+        '''
+        Merge a room report made elsewhere, e.g. by a worker process.
+        '''
+        self.rooms.append(room_report)
+        _add_stage(self.totals, 'generate_new', 1, room_report['seconds'], 0)
+        for name, s in room_report['stages'].items():
+            _add_stage(self.totals, name, s['calls'], s['seconds'], s['vertices'])
+        for name, n in room_report['counters'].items():
+            _add_count(self.totals, name, n)
+
+    def report(self):
+        return dict(rooms=len(self.rooms), stages=self.totals['stages'], counters=self.totals['counters'])
+
+    def format(self):
+        lines = ['{:<32} {:>8} {:>12} {:>12} {:>10}'.format('stage', 'calls', 'total[ms]', 'mean[ms]', 'vertices')]
+        for name, s in sorted(self.totals['stages'].items(), key=lambda item: -item[1]['seconds']):
+            lines.append('{:<32} {:>8} {:>12.3f} {:>12.3f} {:>10}'.format(
+                name, s['calls'], s['seconds']*1e3, s['seconds']*1e3/s['calls'], s['vertices']))
+        for name, n in self.totals['counters'].items():
+            lines.append('{:<32} {:>8}'.format(name, n))
+        return '\n'.join(lines)
+
+class _Stage(object):
+    __slots__ = ('profile', 'name', 'start', 'vertices')
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+        self.vertices = 0
+
+    def geometry(self, geoms):
+        self.vertices += count_vertices(geoms)
+        return geoms
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profile.add_stage(self.name, time.perf_counter() - self.start, self.vertices)
+        return False
+
+class _NullStage(object):
+    __slots__ = ()
+
+    def geometry(self, geoms):
+        return geoms
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_null_stage = _NullStage()
+
+def is_enabled():
+    return len(_active.profiles) > 0
+
+def current():
+    return _active.profiles[-1] if _active.profiles else None
+
+@contextmanager
+def profile(target=None):
+    '''
+    Activate a Profile (a new one if target is None) for the block in current thread.
+    '''
+    prof = Profile() if target is None else target
+    _active.profiles.append(prof)
+    try:
+        yield prof
+    finally:
+        _active.profiles.remove(prof)
+
+def stage(name):
+    '''
+    Context timing a stage. Call geometry(g) on it to record vertex counts of results.
+    '''
+    profiles = _active.profiles
+    if not profiles:
+        return _null_stage
+    return _Stage(profiles[-1], name)
+
+def count(name, n=1):
+    profiles = _active.profiles
+    if profiles:
+        profiles[-1].add_count(name, n)
+
+def room_stage(generate_new):
+    '''
+    Decorator of generate_new, or of a function(generator, ...) drawing one room by it.
+    The outermost call of a chain of super().generate_new makes one room report.
+    '''
+    @wraps(generate_new)
+    def wrapper(self, *args, **kwargs):
+        profiles = _active.profiles
+        if not profiles:
+            return generate_new(self, *args, **kwargs)
+        prof = profiles[-1]
+        if prof._depth > 0:
+            prof._depth += 1
+            try:
+                return generate_new(self, *args, **kwargs)
+            finally:
+                prof._depth -= 1
+
+        prof._room = _new_report()
+        prof._depth = 1
+        start = time.perf_counter()
+        failed = True
+        try:
+            room_conf = generate_new(self, *args, **kwargs)
+            failed = False
+            return room_conf
+        finally:
+            room, prof._room, prof._depth = prof._room, None, 0
+            room['generator'] = type(self).__name__
+            room['seconds'] = time.perf_counter() - start
+            room['failed'] = failed
+            prof.rooms.append(room)
+            _add_stage(prof.totals, 'generate_new', 1, room['seconds'], 0)
+    return wrapper
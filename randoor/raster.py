@@ -0,0 +1,249 @@
+import numpy as np
+
+def get_grid_axis(resolution=0.05, map_size=512):
+    half_length = (map_size * resolution) / 2
+    return np.linspace(-half_length, half_length, map_size)
+
+def get_rings(geom):
+    '''
+    Polygon or MultiPolygon -> [(exterior_coords, [interior_coords])]
+    '''
+    parts = geom.geoms if hasattr(geom, 'geoms') else [geom]
+    return [(np.asarray(p.exterior.coords)[:,:2], [np.asarray(r.coords)[:,:2] for r in p.interiors]) for p in parts if not p.is_empty]
+
+def transform_rings(rings, origin_pos=(0,0), origin_ori=0):
+    '''
+    Move ring coordinates into the frame of (origin_pos, origin_ori), same as get_moved_poly_rt_tf(poly, -x, -y, -yaw).
+    '''
+    if (origin_pos[0] == 0) and (origin_pos[1] == 0) and (origin_ori == 0):
+        return rings
+    c, s = np.cos(-origin_ori), np.sin(-origin_ori)
+    rot = np.array([[c, s], [-s, c]])
+    offset = np.asarray(origin_pos[:2], dtype=float)
+    move = lambda r: np.dot(r - offset, rot)
+    return [(move(ext), [move(i) for i in ints]) for ext, ints in rings]
+
+def ring_edges(rings):
+    '''
+    Closed rings -> non-horizontal edges (p0, p1)
+    '''
+    if len(rings) == 0:
+        return np.empty([0,2]), np.empty([0,2])
+    p0 = np.concatenate([r[:-1] for r in rings])
+    p1 = np.concatenate([r[1:] for r in rings])
+    keep = p0[:,1] != p1[:,1]
+    return p0[keep], p1[keep]
+
+def even_odd_fill(edges, xs, ys):
+    """even_odd_fill
+
+    Scanline fill of ring edges with even-odd rule over pixel centers.
+
+    Args:
+        edges ((ndarray, ndarray)): Start and end points of edges made by ring_edges.
+        xs (ndarray): Increasing pixel center x coordinates (columns).
+        ys (ndarray): Increasing pixel center y coordinates (rows).
+
+    Returns:
+        ndarray: Boolean mask of shape (len(ys), len(xs)).
+
+    """
+    h, w = len(ys), len(xs)
+    p0, p1 = edges
+    # edges outside of rows or right of columns never toggle a pixel
+    keep = (np.maximum(p0[:,1], p1[:,1]) >= ys[0]) & (np.minimum(p0[:,1], p1[:,1]) <= ys[-1]) & (np.minimum(p0[:,0], p1[:,0]) <= xs[-1])
+    p0, p1 = p0[keep], p1[keep]
+
+    # rows whose center crosses an edge: min(y0,y1) <= y < max(y0,y1)
+    r0 = np.searchsorted(ys, np.minimum(p0[:,1], p1[:,1]), side='left')
+    r1 = np.searchsorted(ys, np.maximum(p0[:,1], p1[:,1]), side='left')
+    counts = r1 - r0
+    total = counts.sum()
+    if total == 0:
+        return np.zeros([h, w], dtype=bool)
+
+    edge = np.repeat(np.arange(len(p0)), counts)
+    starts = np.cumsum(counts) - counts
+    rows = np.repeat(r0, counts) + (np.arange(total) - np.repeat(starts, counts))
+
+    e0, e1 = p0[edge], p1[edge]
+    xc = e0[:,0] + (ys[rows] - e0[:,1]) * (e1[:,0] - e0[:,0]) / (e1[:,1] - e0[:,1])
+    cols = np.searchsorted(xs, xc, side='right')
+
+    toggles = np.bincount(rows*(w+1) + cols, minlength=h*(w+1)).reshape(h, w+1)
+    return (np.cumsum(toggles, axis=1)[:,:w] % 2).astype(bool)
+
+def polygon_edges(rings):
+    return [(ring_edges([ext]), ring_edges(ints)) for ext, ints in rings]
+
+def edges_mask(part_edges, xs, ys):
+    mask = np.zeros([len(ys), len(xs)], dtype=bool)
+    for ext, ints in part_edges:
+        inner = even_odd_fill(ext, xs, ys)
+        if len(ints[0]) > 0:
+            inner &= ~even_odd_fill(ints, xs, ys)
+        mask |= inner
+    return mask
+
+def polygon_mask(space_poly, xs, ys, origin_pos=(0,0), origin_ori=0):
+    rings = transform_rings(get_rings(space_poly), origin_pos, origin_ori)
+    return edges_mask(polygon_edges(rings), xs, ys)
+
+def window_indices(bounds, xs, ys, origin_pos=(0,0), origin_ori=0):
+    '''
+    World bounds (k, [minx, miny, maxx, maxy]) -> pixel windows (k, [r0, r1, c0, c1]) of the grid around origin.
+    '''
+    b = np.asarray(bounds, dtype=float).reshape(-1, 4)
+    corners = b[:, [[0,1], [2,1], [2,3], [0,3]]].reshape(-1, 2)
+    corners = transform_rings([(corners, [])], origin_pos, origin_ori)[0][0].reshape(-1, 4, 2)
+    lo, hi = corners.min(axis=1), corners.max(axis=1)
+    windows = np.empty([len(b), 4], dtype=int)
+    windows[:,0] = np.maximum(np.searchsorted(ys, lo[:,1], side='left') - 1, 0)
+    windows[:,1] = np.minimum(np.searchsorted(ys, hi[:,1], side='right') + 1, len(ys))
+    windows[:,2] = np.maximum(np.searchsorted(xs, lo[:,0], side='left') - 1, 0)
+    windows[:,3] = np.minimum(np.searchsorted(xs, hi[:,0], side='right') + 1, len(xs))
+    return windows
+
+def merge_windows(windows, slack=4096):
+    '''
+    Merge pixel windows while the merged window costs less than slack extra pixels.
+    '''
+    area = lambda w: (w[1]-w[0]) * (w[3]-w[2])
+    merged = []
+    for w in sorted(windows):
+        w = list(w)
+        i = 0
+        while i < len(merged):
+            m = merged[i]
+            u = [min(w[0], m[0]), max(w[1], m[1]), min(w[2], m[2]), max(w[3], m[3])]
+            if area(u) <= area(w) + area(m) + slack:
+                w = u
+                merged.pop(i)
+                i = 0
+            else:
+                i += 1
+        merged.append(w)
+    return merged
+
+def update_mask(mask, space_poly, xs, ys, bounds_list, origin_pos=(0,0), origin_ori=0):
+    '''
+    Re-render mask of space_poly only inside windows covering each world bounds.
+    '''
+    if len(bounds_list) == 0:
+        return mask
+    part_edges = polygon_edges(transform_rings(get_rings(space_poly), origin_pos, origin_ori))
+    windows = window_indices(bounds_list, xs, ys, origin_pos, origin_ori)
+    windows = windows[(windows[:,0] < windows[:,1]) & (windows[:,2] < windows[:,3])]
+    for r0, r1, c0, c1 in merge_windows([tuple(w) for w in windows]):
+        mask[r0:r1, c0:c1] = edges_mask(part_edges, xs[c0:c1], ys[r0:r1])
+    return mask
+
+def _column_distance(mask):
+    '''
+    Distance in pixels from each pixel to nearest False pixel of the same column, inf if none.
+    '''
+    h = mask.shape[0]
+    rows = np.arange(h, dtype=float)[:,np.newaxis]
+    above = np.maximum.accumulate(np.where(mask, -np.inf, rows), axis=0)
+    below = np.minimum.accumulate(np.where(mask, np.inf, rows)[::-1], axis=0)[::-1]
+    return np.minimum(rows - above, below - rows)
+
+def distance_transform(mask):
+    """distance_transform
+
+    Exact Euclidean distance transform by Felzenszwalb-Huttenlocher lower envelope of parabolas,
+    processed for all rows at once.
+
+    Args:
+        mask (ndarray): (H,W) bool, True for free pixels.
+
+    Returns:
+        ndarray: (H,W) distance in pixels from each pixel to nearest False pixel, inf if there is none.
+
+    """
+    h, w = mask.shape
+    big = 1e12
+    f = _column_distance(mask)
+    f = np.where(np.isinf(f), big, f*f)
+
+    rows = np.arange(h)
+    v = np.zeros([h, w], dtype=int) # parabola apexes of envelope
+    z = np.empty([h, w+1]) # borders between parabolas
+    z[:,0] = -np.inf
+    z[:,1] = np.inf
+    k = np.zeros([h], dtype=int)
+
+    s = np.empty([h])
+    for q in range(1, w):
+        fq = f[:,q] + q*q
+        r = rows
+        # pop parabolas hidden by the one at q, rows that popped are checked again
+        while len(r) > 0:
+            vk = v[r, k[r]]
+            s[r] = (fq[r] - (f[r, vk] + vk*vk)) / (2*q - 2*vk)
+            r = r[s[r] <= z[r, k[r]]]
+            k[r] -= 1
+        k += 1
+        v[rows, k] = q
+        z[rows, k] = s
+        z[rows, k+1] = np.inf
+
+    d = np.empty([h, w])
+    k = np.zeros([h], dtype=int)
+    for q in range(w):
+        while True:
+            step = z[rows, k+1] < q
+            if not step.any():
+                break
+            k += step
+        vk = v[rows, k]
+        d[:,q] = (q - vk)**2 + f[rows, vk]
+    return np.where(d >= big, np.inf, np.sqrt(d))
+
+def inflate(distance, inflation_radius, inscribed_radius=0.0, cost_scaling=10.0, lethal_cost=254, inscribed_cost=253):
+    '''
+    Distance field in meters -> costmap: lethal at obstacles, inscribed within inscribed_radius,
+    exponential decay until inflation_radius, 0 beyond.
+    '''
+    cost = np.zeros(distance.shape, dtype=np.uint8)
+    decay = (distance > inscribed_radius) & (distance <= inflation_radius)
+    cost[decay] = ((inscribed_cost - 1) * np.exp(-cost_scaling * (distance[decay] - inscribed_radius))).astype(np.uint8)
+    cost[(distance > 0) & (distance <= inscribed_radius)] = inscribed_cost
+    cost[distance == 0] = lethal_cost
+    return cost
+
+def colorize(mask, pass_color=255, obs_color=0):
+    data = np.full([mask.size], obs_color, dtype=np.uint8)
+    data[mask.ravel()] = pass_color
+    return data
+
+def rasterize_into(out, space_poly, xs, ys, origin_pos=(0,0), origin_ori=0, pass_color=255, obs_color=0):
+    '''
+    Render space_poly into out (len(ys), len(xs)) in place, pixel axes xs and ys are shared across calls.
+    '''
+    mask = polygon_mask(space_poly, xs, ys, origin_pos, origin_ori)
+    out.fill(obs_color)
+    out[mask] = pass_color
+    return out
+
+def rasterize(space_poly, origin_pos=(0,0), origin_ori=0, resolution=0.05, map_size=512, pass_color=255, obs_color=0):
+    """rasterize
+
+    Function return flatten occupancy grid that rendered space_poly around origin.
+
+    Args:
+        space_poly (Polygon, MultiPolygon): Passable area.
+        origin_pos ((float,float)): Center of grid.
+        origin_ori (float): Yaw of grid.
+        resolution (float): Length of a pixel.
+        map_size (int): Pixel count of each side.
+        pass_color (int): Value of pixels inside space_poly.
+        obs_color (int): Value of other pixels.
+
+    Returns:
+        ndarray: uint8 array of shape (map_size*map_size).
+
+    """
+    lin = get_grid_axis(resolution, map_size)
+    mask = polygon_mask(space_poly, lin, lin, origin_pos, origin_ori)
+    return colorize(mask, pass_color, obs_color)
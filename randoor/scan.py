@@ -0,0 +1,166 @@
+import numpy as np
+
+from .raster import get_rings
+
+def polygon_segments(polys):
+    '''
+    Boundary segments (p0, p1) of all rings of polys, each (S,2).
+    '''
+    rings = [r for p in polys if (p is not None) and (not p.is_empty) for ext, ints in get_rings(p) for r in [ext] + ints]
+    if len(rings) == 0:
+        return np.empty([0,2]), np.empty([0,2])
+    p0 = np.concatenate([r[:-1] for r in rings])
+    p1 = np.concatenate([r[1:] for r in rings])
+    keep = np.any(p0 != p1, axis=1)
+    return p0[keep], p1[keep]
+
+def _expand_ranges(starts, stops):
+    '''
+    Concatenation of arange(start, stop) for each pair -> (owner position, value)
+    '''
+    lengths = np.maximum(stops - starts, 0)
+    owner = np.repeat(np.arange(len(lengths)), lengths)
+    offsets = np.cumsum(lengths) - lengths
+    values = np.arange(lengths.sum()) - np.repeat(offsets, lengths) + np.repeat(starts, lengths)
+    return owner, values
+
+class SegmentGrid(object):
+    '''
+    Uniform grid over line segments for casting many rays at once. Each cell lists segments whose bounds overlap it.
+    '''
+    def __init__(self, p0, p1, cell_size=None):
+        self.p0 = np.asarray(p0, dtype=float).reshape(-1,2)
+        self.p1 = np.asarray(p1, dtype=float).reshape(-1,2)
+        self.lo = np.minimum(self.p0, self.p1)
+        self.hi = np.maximum(self.p0, self.p1)
+        n = len(self.p0)
+        if n == 0:
+            self.origin, self.cell_size, self.shape = np.zeros(2), 1.0, (1, 1)
+            self.cell_start = np.zeros([2], dtype=np.int64)
+            self.cell_items = np.empty([0], dtype=np.int64)
+            return
+
+        self.origin = self.lo.min(axis=0)
+        extent = np.maximum(self.hi.max(axis=0) - self.origin, 1e-9)
+        if cell_size is None:
+            # about one segment per cell on average
+            cell_size = max(np.sqrt(extent[0] * extent[1] / n), extent.max() / 256)
+        self.cell_size = float(cell_size)
+        self.shape = tuple(np.minimum(np.floor(extent / self.cell_size).astype(int) + 1, 4096))
+
+        c0, c1 = self._cells(self.lo), self._cells(self.hi)
+        seg, cx, cy = self._cell_pairs(c0, c1)
+        cell = cx * self.shape[1] + cy
+        order = np.argsort(cell, kind='stable')
+        self.cell_items = seg[order]
+        self.cell_start = np.searchsorted(cell[order], np.arange(self.shape[0]*self.shape[1]+1))
+
+    def __len__(self):
+        return len(self.p0)
+
+    def _cells(self, xy):
+        c = np.floor((xy - self.origin) / self.cell_size).astype(np.int64)
+        return np.clip(c, 0, np.array(self.shape) - 1)
+
+    def _cell_pairs(self, c0, c1):
+        '''
+        (owner, cx, cy) of all cells in the rectangles [c0, c1] of each owner.
+        '''
+        nx = c1[:,0] - c0[:,0] + 1
+        ny = c1[:,1] - c0[:,1] + 1
+        owner, k = _expand_ranges(np.zeros(len(c0), dtype=np.int64), nx * ny)
+        return owner, c0[owner,0] + k // ny[owner], c0[owner,1] + k % ny[owner]
+
+    def query_radius(self, xy, radius):
+        '''
+        (owner, segment) pairs of segments whose bounds are within radius of each point of xy (P,2).
+        '''
+        xy = np.asarray(xy, dtype=float).reshape(-1,2)
+        if len(self) == 0:
+            return np.empty([0], dtype=np.int64), np.empty([0], dtype=np.int64)
+        owner, cx, cy = self._cell_pairs(self._cells(xy - radius), self._cells(xy + radius))
+        cell = cx * self.shape[1] + cy
+        slot, item = _expand_ranges(self.cell_start[cell], self.cell_start[cell+1])
+        owner, seg = owner[slot], self.cell_items[item]
+        # segments span several cells, keep each pair once
+        key = np.unique(owner * len(self) + seg)
+        owner, seg = key // len(self), key % len(self)
+        near = np.all((self.lo[seg] <= xy[owner] + radius) & (xy[owner] - radius <= self.hi[seg]), axis=1)
+        return owner[near], seg[near]
+
+    def cast(self, x, y, yaw, n_beams=360, max_range=10.0, fov=2*np.pi, max_pairs=2**22):
+        """cast
+
+        Function return distances along beams from poses to the nearest segment.
+        Beams are yaw + linspace(-fov/2, fov/2, n_beams), without the last one when fov is a full turn.
+
+        Args:
+            x (float or ndarray): X of poses.
+            y (float or ndarray): Y of poses, broadcast with x and yaw.
+            yaw (float or ndarray): Heading of poses [rad].
+            n_beams (int): Number of beams per pose.
+            max_range (float): Range of beams that hit nothing.
+            fov (float): Angle covered by beams [rad].
+            max_pairs (int): Max beam-segment pairs tested at once, poses are split to keep under it.
+
+        Returns:
+            ndarray: (*pose shape, n_beams) distances.
+
+        """
+        x, y, yaw = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float), np.asarray(yaw, dtype=float))
+        shape = x.shape
+        poses = np.stack([x.ravel(), y.ravel(), yaw.ravel()], axis=1)
+        full_turn = fov >= 2*np.pi - 1e-12
+        increment = fov / n_beams if full_turn else (fov / (n_beams - 1) if n_beams > 1 else 0.0)
+        offsets = -fov/2 + increment * np.arange(n_beams)
+
+        ranges = np.full([len(poses), n_beams], float(max_range))
+        if len(self) > 0:
+            chunk = max(int(max_pairs // max(n_beams * 8, 1)), 1)
+            for start in range(0, len(poses), chunk):
+                self._cast_chunk(poses[start:start+chunk], offsets, increment, max_range, ranges[start:start+chunk])
+        return ranges.reshape(shape + (n_beams,))
+
+    def _cast_chunk(self, poses, offsets, increment, max_range, out):
+        n_beams = len(offsets)
+        owner, seg = self.query_radius(poses[:,:2], max_range)
+        if len(seg) == 0:
+            return
+        a = self.p0[seg] - poses[owner,:2]
+        b = self.p1[seg] - poses[owner,:2]
+
+        # angular span [t_lo, t_lo+width] of each segment, relative to the first beam of its pose
+        first = poses[owner,2] + offsets[0]
+        theta_a = np.arctan2(a[:,1], a[:,0])
+        delta = np.mod(np.arctan2(b[:,1], b[:,0]) - theta_a + np.pi, 2*np.pi) - np.pi
+        t_lo = np.mod(np.minimum(theta_a, theta_a + delta) - first, 2*np.pi)
+        width = np.abs(delta)
+
+        # beams in the span, one beam of slack on both sides against rounding, split where it wraps around
+        if increment > 0:
+            k0 = np.floor(t_lo / increment).astype(np.int64)
+            k1 = np.floor((t_lo + width) / increment).astype(np.int64) + 2
+            wrap = np.floor((t_lo + width - 2*np.pi) / increment).astype(np.int64) + 2
+        else:
+            k0 = np.zeros(len(seg), dtype=np.int64)
+            k1 = np.ones(len(seg), dtype=np.int64)
+            wrap = np.zeros(len(seg), dtype=np.int64)
+        lo = np.concatenate([np.clip(k0, 0, n_beams), np.zeros(len(seg), dtype=np.int64)])
+        hi = np.concatenate([np.clip(k1, 0, n_beams), np.clip(wrap, 0, n_beams)])
+        lo[len(seg):] = np.minimum(lo[len(seg):], hi[len(seg):])
+        hi[len(seg):] = np.minimum(hi[len(seg):], lo[:len(seg)]) # do not test a beam twice
+        pair, beam = _expand_ranges(lo, hi)
+        pair = pair % len(seg)
+
+        # ray o + t*r against segment a + s*e
+        phi = poses[owner[pair],2] + offsets[beam]
+        r = np.stack([np.cos(phi), np.sin(phi)], axis=1)
+        pa = a[pair]
+        e = b[pair] - pa
+        denom = r[:,0]*e[:,1] - r[:,1]*e[:,0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = (pa[:,0]*e[:,1] - pa[:,1]*e[:,0]) / denom
+            s = (pa[:,0]*r[:,1] - pa[:,1]*r[:,0]) / denom
+        hit = (denom != 0) & (t >= 0) & (t < max_range) & (s >= 0) & (s <= 1)
+        flat = out.reshape(-1)
+        np.minimum.at(flat, owner[pair[hit]] * n_beams + beam[hit], t[hit])
@@ -1,40 +1,347 @@
 from shapely.geometry import Polygon, MultiPolygon
-from sklearn.cluster import DBSCAN
 import numpy as np
-from trimesh.path.polygons import sample
 
-def sample_sprinkle(area_poly, count, sample_thresh):
+from ..utils import get_rng
+from ..raster import get_rings, ring_edges
+from .. import profiling
+
+try:
+    from shapely import centroid, get_coordinates
+except ImportError: # shapely < 2.0
+    centroid = None
+
+class SamplingError(ValueError):
+    '''
+    Raised when points cannot be sampled: the area is empty, or spaced points are not found within the attempt limit.
+    '''
+
+def triangulate_area(area_poly):
+    """triangulate_area
+
+    Function return triangles that exactly cover area_poly. Area is cut into slabs at every vertex height,
+    edges crossing each slab are paired by even-odd rule into trapezoids, and each trapezoid is split in two.
+
+    Args:
+        area_poly (Polygon, MultiPolygon): Valid polygonal area, holes allowed.
+
+    Returns:
+        ndarray: (T,3,2) triangle vertices.
+
+    """
+    rings = [r for ext, ints in get_rings(area_poly) for r in [ext] + ints]
+    p0, p1 = ring_edges(rings)
+    if len(p0) == 0:
+        return np.empty([0,3,2])
+    upward = (p0[:,1] < p1[:,1])[:,np.newaxis]
+    lo = np.where(upward, p0, p1)
+    hi = np.where(upward, p1, p0)
+
+    # edge spans slabs [s0, s1) between consecutive vertex heights
+    ys = np.unique(np.concatenate([lo[:,1], hi[:,1]]))
+    s0 = np.searchsorted(ys, lo[:,1])
+    counts = np.searchsorted(ys, hi[:,1]) - s0
+    total = counts.sum()
+    edge = np.repeat(np.arange(len(lo)), counts)
+    starts = np.cumsum(counts) - counts
+    slab = np.repeat(s0, counts) + (np.arange(total) - np.repeat(starts, counts))
+
+    y0, y1 = ys[slab], ys[slab+1]
+    slope = (hi[edge,0] - lo[edge,0]) / (hi[edge,1] - lo[edge,1])
+    x0 = lo[edge,0] + (y0 - lo[edge,1]) * slope
+    x1 = lo[edge,0] + (y1 - lo[edge,1]) * slope
+
+    order = np.lexsort((x0 + x1, slab))
+    slab, y0, y1, x0, x1 = slab[order], y0[order], y1[order], x0[order], x1[order]
+    rank = np.arange(total) - np.searchsorted(slab, slab, side='left')
+    left = np.nonzero((rank % 2 == 0)[:-1] & (slab[:-1] == slab[1:]))[0]
+    right = left + 1
+
+    l0 = np.stack([x0[left], y0[left]], axis=1)
+    r0 = np.stack([x0[right], y0[right]], axis=1)
+    r1 = np.stack([x1[right], y1[right]], axis=1)
+    l1 = np.stack([x1[left], y1[left]], axis=1)
+    return np.concatenate([np.stack([l0, r0, r1], axis=1), np.stack([l0, r1, l1], axis=1)])
+
+def triangle_areas(triangles):
+    ab = triangles[:,1] - triangles[:,0]
+    ac = triangles[:,2] - triangles[:,0]
+    return np.abs(ab[:,0]*ac[:,1] - ab[:,1]*ac[:,0]) / 2
+
+def sample_triangles(triangles, counts, owners=None, rng=None):
+    """sample_triangles
+
+    Function return points uniformly sampled from triangles weighted by area, without rejection.
+
+    Args:
+        triangles (ndarray): (T,3,2) triangle vertices.
+        counts (int, List[int]): Number of points, or number for each owner.
+        owners (ndarray): (T,) index of owner of each triangle, sorted. All triangles are one owner if None.
+        rng (Generator): Random source. Global np.random state is used if None.
+
+    Returns:
+        ndarray: (sum(counts),2) points grouped by owner.
+
+    """
+    rng = get_rng(rng)
+    areas = triangle_areas(triangles)
+    if owners is None:
+        owners = np.zeros([len(triangles)], dtype=int)
+    counts = np.atleast_1d(counts)
+    n_owners = len(counts)
+
+    cum = np.cumsum(areas)
+    owner_area = np.bincount(owners, weights=areas, minlength=n_owners)
+    if (owner_area[counts > 0] <= 0).any():
+        profiling.count('sample.failures')
+        raise SamplingError('sampling area is empty')
+    owner_start = np.cumsum(owner_area) - owner_area
+
+    point_owner = np.repeat(np.arange(n_owners), counts)
+    target = owner_start[point_owner] + rng.random(len(point_owner)) * owner_area[point_owner]
+    idx = np.clip(np.searchsorted(cum, target, side='right'), 0, len(triangles)-1)
+    # keep chosen triangle inside its owner against rounding at owner borders
+    first = np.searchsorted(owners, point_owner, side='left')
+    last = np.searchsorted(owners, point_owner, side='right') - 1
+    idx = np.clip(idx, first, last)
+
+    u, v = rng.random((2, len(idx)))
+    flip = u + v > 1
+    u[flip], v[flip] = 1 - u[flip], 1 - v[flip]
+    tri = triangles[idx]
+    points = tri[:,0] + u[:,np.newaxis]*(tri[:,1] - tri[:,0]) + v[:,np.newaxis]*(tri[:,2] - tri[:,0])
+
+    profiling.count('sample.points', len(points))
+    return points
+
+def triangulate_areas(polys):
+    '''
+    -> (triangles (T,3,2), owners (T,)) of all polys, reusable by sample_triangulated.
+    '''
+    tris = [triangulate_area(p) for p in polys]
+    if len(tris) == 0:
+        return np.empty([0,3,2]), np.empty([0], dtype=int)
+    owners = np.repeat(np.arange(len(tris)), [len(t) for t in tris])
+    return np.concatenate(tris), owners
+
+def sample_triangulated(triangles, owners, n_polys, count, rng=None):
+    '''
+    Same as sample_polygons on n_polys polygons triangulated by triangulate_areas.
+    '''
+    if n_polys == 0:
+        return np.empty([0,count,2])
+    points = sample_triangles(triangles, [count]*n_polys, owners, rng)
+    return points.reshape(n_polys, count, 2)
+
+def sample_polygons(polys, count, rng=None):
+    """sample_polygons
+
+    Function return count points sampled uniformly inside each polygon at once.
+
+    Args:
+        polys (List[Polygon, MultiPolygon]): Sampling areas.
+        count (int): Number of points for each polygon.
+        rng (Generator): Random source. Global np.random state is used if None.
+
+    Returns:
+        ndarray: (len(polys),count,2) points.
+
+    """
+    triangles, owners = triangulate_areas(polys)
+    return sample_triangulated(triangles, owners, len(polys), count, rng)
+
+def sample_sprinkle(area_poly, count, sample_thresh, rng=None):
+    rng = get_rng(rng)
     sample_area = area_poly.buffer(-1*(sample_thresh))
-    xy = sample(sample_area, count) # 2D
-    yaw = np.random.random(count)*np.pi*2
+    xy = sample_triangles(triangulate_area(sample_area), count, rng=rng) # 2D
+    yaw = rng.random(count)*np.pi*2
     return xy, yaw
 
-def sample_sure(area_poly, count, supplemental_range=0.2):
-    factor = count / supplemental_range
-    sampled = []
-    while not len(sampled) == count:
-        sampled = sample(area_poly, count, factor)
-    return sampled
+def sample_spaced(area_poly, count, min_distance, sample_thresh=0, max_attempts=None, batch_max=1024, rng=None):
+    """sample_spaced
+
+    Function return count points inside area_poly shrunk by sample_thresh, no two closer than min_distance.
+    Candidates are drawn in batches and rejected against a hash grid of accepted points whose cells hold at most one point,
+    then accepted in order within the batch.
+
+    Args:
+        area_poly (Polygon, MultiPolygon): Sampling area.
+        count (int): Number of points.
+        min_distance (float): Minimum distance between points.
+        sample_thresh (float): Distance kept from border of area_poly.
+        max_attempts (int): Limit of candidates drawn, 30*count if None.
+        batch_max (int): Limit of candidates drawn at once.
+        rng (Generator): Random source. Global np.random state is used if None.
+
+    Returns:
+        ndarray: (count,2) points. Raises SamplingError if the shrunk area is empty
+            or the points are not found within max_attempts candidates.
+
+    """
+    rng = get_rng(rng)
+    triangles = triangulate_area(area_poly.buffer(-1*(sample_thresh)))
+    if (count == 0) or (min_distance <= 0):
+        return sample_triangles(triangles, count, rng=rng)
+    if max_attempts is None:
+        max_attempts = 30*count
+    if (len(triangles) == 0) or (triangle_areas(triangles).sum() <= 0):
+        profiling.count('sample.failures')
+        raise SamplingError('sampling area is empty')
+
+    corners = triangles.reshape(-1,2)
+    origin = corners.min(axis=0)
+    cell = min_distance / np.sqrt(2) # cell diagonal is min_distance, so a cell holds at most one point
+    shape = np.floor((corners.max(axis=0) - origin) / cell).astype(int) + 1
+    pad = 2 # neighbors within min_distance are at most 2 cells away
+    grid = np.full([shape[1]+2*pad, shape[0]+2*pad], -1, dtype=int)
+    oy, ox = [o.ravel() for o in np.mgrid[-pad:pad+1, -pad:pad+1]]
+    limit = min_distance**2
+
+    points = np.empty([count, 2])
+    n, attempts = 0, 0
+    while n < count:
+        if attempts >= max_attempts:
+            profiling.count('sample.failures')
+            raise SamplingError('could not place {} points {} apart within {} attempts'.format(count, min_distance, max_attempts))
+        # grow batches as acceptance rate drops
+        rate = n / float(attempts) if n > 0 else 1.0
+        size = min(max(int(2*(count-n) / max(rate, 1e-3)), 16), batch_max, max_attempts-attempts)
+        cand = sample_triangles(triangles, size, rng=rng)
+        attempts += size
+        c = np.floor((cand - origin) / cell).astype(int) + pad
+        cx, cy = c[:,0], c[:,1]
+
+        # against accepted points
+        neighbor = grid[cy[:,np.newaxis]+oy, cx[:,np.newaxis]+ox]
+        d = points[np.maximum(neighbor, 0)] - cand[:,np.newaxis]
+        free = ~((neighbor >= 0) & ((d[...,0]**2 + d[...,1]**2) < limit)).any(axis=1)
+        cand, cx, cy = cand[free], cx[free], cy[free]
 
-def get_cluster(polys, thresh):
+        # against each other, a candidate is kept if no kept earlier candidate is close (same as accepting one by one).
+        # decided in rounds, each round settles at least the first undecided candidate
+        d = cand[:,np.newaxis] - cand[np.newaxis]
+        earlier = np.tril((d[...,0]**2 + d[...,1]**2) < limit, -1)
+        keep = ~earlier.any(axis=1)
+        undecided = np.nonzero(~keep)[0]
+        alive = np.ones([len(cand)], dtype=bool) # kept or undecided
+        while len(undecided) > 0:
+            rows = earlier[undecided]
+            rejected = (rows & keep).any(axis=1)
+            accepted = ~(rows & alive).any(axis=1)
+            keep[undecided[accepted]] = True
+            alive[undecided[rejected]] = False
+            undecided = undecided[~(accepted | rejected)]
+        accepted = np.nonzero(keep)[0][:count-n]
+
+        k = len(accepted)
+        points[n:n+k] = cand[accepted]
+        grid[cy[accepted], cx[accepted]] = np.arange(n, n+k)
+        n += k
+    profiling.count('sample.retries', attempts - count)
+    return points
+
+def sample_sure(area_poly, count, supplemental_range=0.2, rng=None):
+    '''
+    note: always returns exactly count points, raises SamplingError if area_poly has no area.
+    supplemental_range is kept for compatibility.
+    '''
+    return sample_triangles(triangulate_area(area_poly), count, rng=rng)
+
+def radius_neighbor_pairs(points, eps):
+    '''
+    -> (i, j) index arrays of all pairs i < j within distance eps, found by hashing points into cells of size eps.
+    '''
+    cell = np.floor((points - points.min(axis=0)) / eps).astype(np.int64)
+    width = cell[:,1].max() + 3
+    keys = (cell[:,0]+1) * width + (cell[:,1]+1)
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    pairs_i, pairs_j = [], []
+    for dx, dy in [(0,0), (1,-1), (1,0), (1,1), (0,1)]: # half of the 3x3 neighborhood
+        target = keys + dx*width + dy
+        start = np.searchsorted(sorted_keys, target, side='left')
+        end = np.searchsorted(sorted_keys, target, side='right')
+        n = end - start
+        i = np.repeat(np.arange(len(points)), n)
+        j = order[np.repeat(start - np.cumsum(n) + n, n) + np.arange(n.sum())]
+        if (dx, dy) == (0,0):
+            keep = i < j
+            i, j = i[keep], j[keep]
+        pairs_i.append(i)
+        pairs_j.append(j)
+    i, j = np.concatenate(pairs_i), np.concatenate(pairs_j)
+    d = points[i] - points[j]
+    near = np.sqrt(d[:,0]*d[:,0] + d[:,1]*d[:,1]) <= eps
+    return i[near], j[near]
+
+def connected_labels(n, i, j):
+    '''
+    Component labels of graph with n nodes and edges (i, j), numbered in order of each component's smallest node.
+    '''
+    root = np.arange(n)
+    while True:
+        # hook both ends to smaller root, then compress paths
+        low = np.minimum(root[i], root[j])
+        prev = root.copy()
+        np.minimum.at(root, root[i], low)
+        np.minimum.at(root, root[j], low)
+        while True:
+            jumped = root[root]
+            if np.array_equal(jumped, root):
+                break
+            root = jumped
+        if np.array_equal(root, prev):
+            break
+    return np.unique(root, return_inverse=True)[1]
+
+def cluster_points(points, eps):
+    """cluster_points
+
+    Function return labels equal to DBSCAN(eps, min_samples=1), namely connected components of
+    points linked within distance eps, numbered in order of first appearance.
+
+    Args:
+        points (ndarray): (N,2) points.
+        eps (float): Distance threshold.
+
+    Returns:
+        ndarray: (N,) cluster labels.
+
+    """
+    points = np.asarray(points, dtype=float).reshape(-1,2)
+    if len(points) == 0:
+        return np.empty([0], dtype=int)
+    i, j = radius_neighbor_pairs(points, eps)
+    return connected_labels(len(points), i, j)
+
+def get_cluster(polys, thresh, method='grid'):
     """get_cluster
 
-    Function return cluster of that calculated by clustering polygons with DBSCAN.
+    Function return cluster of that calculated by clustering polygons centroid with DBSCAN(min_samples=1).
 
     Args:
         polys (MultiPolygon, List[Polygon]): Clustering target.
         thresh ([type]): Distance threshold for clustering.
+        method (str): 'grid' for built-in cell hashing and union-find, 'sklearn' for sklearn.cluster.DBSCAN.
 
     Returns:
         List[int]: Cluster labels.
         List[(float,float)]: points xy of polygons centroid.
 
     """
-    points = np.array([p.centroid.coords[0] for p in polys])
-    db = DBSCAN(eps=thresh, min_samples=1).fit(points)
-    return db.labels_, points
+    if hasattr(polys, 'geoms'):
+        polys = list(polys.geoms)
+    if centroid is not None:
+        points = get_coordinates(centroid(np.asarray(polys, dtype=object)))
+    else:
+        points = np.array([p.centroid.coords[0] for p in polys])
+    with profiling.stage('cluster'):
+        if method == 'sklearn':
+            from sklearn.cluster import DBSCAN
+            return DBSCAN(eps=thresh, min_samples=1).fit(points).labels_, points
+        return cluster_points(points, thresh), points
 
-def sample_from_faces(polys, count=1, face_size=0.2):
+def sample_from_faces(polys, count=1, face_size=0.2, rng=None):
     """sample_each_cluster
 
     Function return sample position from faces of clusters that made by clustering polys with DBSCAN.
@@ -42,14 +349,11 @@ def sample_from_faces(polys, count=1, face_size=0.2):
     Args:
         polys (MultiPolygon, List[Polygon]): Polygons for sampling coordinates from faces.
         thresh (float): Distance threshold for clustering.
+        rng (Generator): Random source. Global np.random state is used if None.
 
     Returns:
         List[(float,float)]: Coordinates (x,y) by sampled.
     
     """
-    results = np.empty([len(polys),count,2])
-    for i, p in enumerate(polys):
-        face = Polygon(p.buffer(face_size).exterior.coords, [p.exterior.coords])
-        results[i] = sample_sure(face, count, face_size)
-
-    return results
\ No newline at end of file
+    faces = [Polygon(p.buffer(face_size).exterior.coords, [p.exterior.coords]) for p in polys]
+    return sample_polygons(faces, count, rng)
\ No newline at end of file
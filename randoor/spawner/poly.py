@@ -2,50 +2,150 @@ import numpy as np
 from shapely.affinity import affine_transform
 
 from shapely.geometry import Polygon, MultiPoint, MultiPolygon
-from shapely.ops import unary_union, triangulate
+from shapely.ops import unary_union
 
-from ..utils import get_affine_rt_tf, get_affine_tf_rt, get_square_horizon
-from . import geom
+from ..utils import get_affine_rt_tf, get_affine_tf_rt, get_square_horizon, get_rectangle_horizon, get_rng, transform_points_tf_rt
+from . import geom, wall
+
+try:
+    from shapely import polygons as shapely_polygons, linearrings, multipoints, convex_hull, get_exterior_ring, get_coordinates
+    import shapely
+except ImportError: # shapely < 2.0
+    shapely_polygons = None
 
 def simple_cube(cube_size, xy=(0,0), yaw=0):
     return Polygon(get_square_horizon(xy, cube_size/2, yaw))
 
-def sprinkle_cube(area_poly, count, cube_size, interior_thresh=0):
-    xy, yaw = geom.sample_sprinkle(area_poly, count, cube_size+interior_thresh)
-    return xy, yaw, [Polygon(get_square_horizon(p, cube_size/2, r)) for p, r in zip(xy, yaw)]
+def polygons_from_vertices(vertices):
+    '''
+    (N,k,2) vertices -> N polygons
+    '''
+    polys = np.empty([len(vertices)], dtype=object)
+    if len(vertices) == 0:
+        return polys
+    if shapely_polygons is None:
+        polys[:] = [Polygon(v) for v in vertices]
+    else:
+        polys[:] = shapely_polygons(vertices)
+    return polys
+
+def sprinkle_cube(area_poly, count, cube_size, interior_thresh=0, rng=None):
+    xy, yaw = geom.sample_sprinkle(area_poly, count, cube_size+interior_thresh, rng)
+    return xy, yaw, polygons_from_vertices(get_rectangle_horizon(xy, cube_size/2, yaw))
+
+def place_cube(area_poly, count, cube_size, interior_thresh=0, gap=0.0, max_attempts=None, rng=None):
+    '''
+    Same as sprinkle_cube, but cube centers are at least cube_size*sqrt(2) + gap apart, so cubes of any yaw never overlap.
+    note: raises geom.SamplingError if the area is empty or count cubes are not placed within max_attempts candidates (30*count if None).
+    '''
+    rng = get_rng(rng)
+    xy = geom.sample_spaced(area_poly, count, cube_size*np.sqrt(2) + gap, cube_size+interior_thresh, max_attempts, rng=rng)
+    yaw = rng.random(count)*np.pi*2
+    return xy, yaw, polygons_from_vertices(get_rectangle_horizon(xy, cube_size/2, yaw))
+
+def cluster_hulls(polys, label, cls_count):
+    '''
+    Convex hull of exterior vertices of each cluster, computed for all clusters at once on shapely >= 2.0.
+    '''
+    if shapely_polygons is None:
+        return [MultiPoint(np.concatenate([p.exterior.coords for p in polys[label==i]])).convex_hull for i in range(cls_count)]
+    coords, owner = get_coordinates(get_exterior_ring(polys), return_index=True)
+    order = np.argsort(label[owner], kind='stable')
+    return list(convex_hull(multipoints(coords[order], indices=label[owner][order])))
 
 def create_zones(polys, label):
-    parray = np.array(polys)
+    parray = np.empty([len(polys)], dtype=object)
+    parray[:] = list(polys)
+    label = np.asarray(label)
     cls_count = max(label)+1
 
-    zone_polys = [None]*cls_count
-    zone_hulls = [None]*cls_count
-
-    for i in range(cls_count):
-        cluster = parray[label==i]
-        vertices = [p.exterior.coords for p in cluster]
-        vertices_all = np.concatenate(vertices)
-        zone_polys[i] = unary_union(cluster)
-        zone_hulls[i] = MultiPoint(vertices_all).convex_hull
+    zone_polys = [unary_union(parray[label==i]) for i in range(cls_count)]
+    zone_hulls = cluster_hulls(parray, label, cls_count)
     
     return zone_polys, zone_hulls
 
-def get_clustered_zones(polys, thresh):
-    label, _ = geom.get_cluster(polys, thresh)
+def get_clustered_zones(polys, thresh, method='grid'):
+    label, _ = geom.get_cluster(polys, thresh, method)
     return create_zones(polys, label)
 
-def random_triangulation(n_points=10, x_min=-10, x_max=10, y_min=-10, y_max=10):
+def buffered_intersections(area_poly, geoms, distance, quad_segs=16):
+    """buffered_intersections
+
+    Function return area_poly.intersection(g.buffer(distance)) for all geoms at once.
+    Buffers are made in one call, those whose bounds miss area_poly or that do not intersect prepared area_poly
+    are empty without overlay, and area_poly is clipped to the bounds of each buffer before intersecting.
+
+    Args:
+        area_poly (Polygon, MultiPolygon): Area to intersect with.
+        geoms (List[Polygon]): Geometries to buffer.
+        distance (float): Buffer distance.
+        quad_segs (int): Segments per quarter circle, 16 is the default of Polygon.buffer.
+
+    Returns:
+        ndarray: (len(geoms),) intersections, empty Polygon where there is none.
+
+    """
+    result = np.empty([len(geoms)], dtype=object)
+    if shapely_polygons is None:
+        result[:] = [area_poly.intersection(g.buffer(distance, quad_segs)) for g in geoms]
+        return result
+    result[:] = Polygon()
+    if (len(geoms) == 0) or area_poly.is_empty:
+        return result
+    bufs = shapely.buffer(np.asarray(list(geoms), dtype=object), distance, quad_segs=quad_segs)
+    bounds = shapely.bounds(bufs)
+    a = area_poly.bounds
+    cand = (bounds[:,0] <= a[2]) & (a[0] <= bounds[:,2]) & (bounds[:,1] <= a[3]) & (a[1] <= bounds[:,3])
+    shapely.prepare(area_poly)
+    cand[cand] = shapely.intersects(area_poly, bufs[cand])
+    idx = np.nonzero(cand)[0]
+    clipped = np.array([shapely.clip_by_rect(area_poly, *bounds[i]) for i in idx], dtype=object).reshape(-1)
+    # clipping is not guaranteed to give valid polygons, those fall back to the whole area
+    invalid = ~shapely.is_valid(clipped)
+    clipped[invalid] = area_poly
+    result[idx] = shapely.intersection(clipped, bufs[idx])
+    return result
+
+def random_triangulation(n_points=10, x_min=-10, x_max=10, y_min=-10, y_max=10, rng=None):
     assert x_min < x_max, 'x_min must be lower than x_max'
     assert y_min < y_max, 'y_min must be lower than y_max'
-    points = np.random.random([n_points, 2])
-    points[:,0] = points[:,0] * (x_max - x_min) + x_min
-    points[:,1] = points[:,1] * (y_max - y_min) + y_min
-    return unary_union(triangulate(MultiPoint(points)))
+    # union of Delaunay triangles of points is their convex hull
+    return wall.convex_hull_of(wall.random_points(n_points, x_min, x_max, y_min, y_max, rng))
 
 def get_moved_poly_tf_rt(base_geom, x, y, yaw):
     aff = get_affine_tf_rt(x,y,yaw)
     return affine_transform(base_geom, [aff[0,0], aff[0,1], aff[1,0], aff[1,1], aff[0,2], aff[1,2]])
 
+def get_moved_polys_tf_rt(base_geom, x_y_yaw):
+    """get_moved_polys_tf_rt
+
+    Function return base_geom moved to each pose, vertices of all poses are transformed at once.
+
+    Args:
+        base_geom (Polygon): Base shape.
+        x_y_yaw (ndarray): (N,3) poses.
+
+    Returns:
+        ndarray: N moved polygons.
+
+    """
+    x_y_yaw = np.asarray(x_y_yaw, dtype=float).reshape(-1,3)
+    polys = np.empty([len(x_y_yaw)], dtype=object)
+    if not isinstance(base_geom, Polygon):
+        polys[:] = [get_moved_poly_tf_rt(base_geom, p[0], p[1], p[2]) for p in x_y_yaw]
+        return polys
+
+    rings = [base_geom.exterior] + list(base_geom.interiors)
+    moved = [transform_points_tf_rt(np.asarray(r.coords)[:,:2], x_y_yaw) for r in rings]
+    if shapely_polygons is None:
+        polys[:] = [Polygon(moved[0][i], [m[i] for m in moved[1:]]) for i in range(len(x_y_yaw))]
+        return polys
+
+    shells = linearrings(moved[0])
+    holes = np.stack([linearrings(m) for m in moved[1:]], axis=1) if len(moved) > 1 else None
+    polys[:] = shapely_polygons(shells, holes)
+    return polys
+
 def get_moved_poly_rt_tf(base_geom, x, y, yaw):
     aff = get_affine_rt_tf(x,y,yaw)
-    return affine_transform(base_geom, [aff[0,0], aff[0,1], aff[1,0], aff[1,1], aff[0,2], aff[1,2]])
\ No newline at end of file
+    return affine_transform(base_geom, [aff[0,0], aff[0,1], aff[1,0], aff[1,1], aff[0,2], aff[1,2]])
\ No newline at end of file
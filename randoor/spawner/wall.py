@@ -0,0 +1,132 @@
+import numpy as np
+from shapely.geometry import Polygon, MultiPoint, box
+from shapely.ops import unary_union, triangulate
+
+from ..utils import get_rng
+
+try:
+    from shapely import multipoints, get_coordinates, get_parts, delaunay_triangles, coverage_union_all
+    from shapely.errors import GEOSException
+except ImportError: # shapely < 2.0
+    multipoints = None
+
+def random_points(n_points, x_min, x_max, y_min, y_max, rng=None):
+    points = get_rng(rng).random([n_points, 2])
+    points[:,0] = points[:,0] * (x_max - x_min) + x_min
+    points[:,1] = points[:,1] * (y_max - y_min) + y_min
+    return points
+
+def convex_hull_of(points):
+    if multipoints is not None:
+        return multipoints(points).convex_hull
+    return MultiPoint(points).convex_hull
+
+def _largest_polygon(geom):
+    if geom.geom_type == 'Polygon':
+        return Polygon(geom.exterior)
+    return Polygon(max(geom.geoms, key=lambda g: g.area).exterior)
+
+def convex_room(half_length, n_points, rng=None):
+    '''
+    Convex hull of n_points uniform points in the square, same shape as union of their Delaunay triangulation.
+    '''
+    return convex_hull_of(random_points(n_points, -half_length, half_length, -half_length, half_length, rng))
+
+def alpha_room(half_length, n_points, alpha_radius=None, rng=None):
+    """alpha_room
+
+    Function return alpha shape of uniform random points, namely union of Delaunay triangles whose circumradius
+    is at most alpha_radius. Only the outline of the largest part is kept, so result is a non-convex polygon without holes.
+
+    Args:
+        half_length (float): Half side of the square where points are sampled.
+        n_points (int): Number of points.
+        alpha_radius (float): Max circumradius of kept triangles. half_length/2 if None.
+        rng (Generator): Random source. Global np.random state is used if None.
+
+    Returns:
+        Polygon: Room area. Convex hull if no triangle is kept.
+
+    """
+    if alpha_radius is None:
+        alpha_radius = half_length / 2
+    points = random_points(n_points, -half_length, half_length, -half_length, half_length, rng)
+    if multipoints is not None:
+        tris = get_parts(delaunay_triangles(multipoints(points)))
+        t = get_coordinates(tris).reshape(-1,4,2)[:,:3]
+    else:
+        tris = triangulate(MultiPoint(points))
+        t = np.array([np.asarray(tri.exterior.coords)[:3] for tri in tris]).reshape(-1,3,2)
+
+    # circumradius R = abc / 4A for all triangles at once
+    a = np.linalg.norm(t[:,1] - t[:,2], axis=1)
+    b = np.linalg.norm(t[:,2] - t[:,0], axis=1)
+    c = np.linalg.norm(t[:,0] - t[:,1], axis=1)
+    ab, ac = t[:,1] - t[:,0], t[:,2] - t[:,0]
+    area = np.abs(ab[:,0]*ac[:,1] - ab[:,1]*ac[:,0]) / 2
+    keep = (area > 0) & (a*b*c <= 4*area*alpha_radius)
+    if not keep.any():
+        return convex_hull_of(points)
+
+    union = None
+    if multipoints is not None:
+        # Delaunay triangles share whole edges, so they form a coverage unless rounding makes slivers overlap
+        try:
+            union = coverage_union_all(tris[keep])
+        except GEOSException:
+            pass
+    if union is None:
+        union = unary_union([tris[i] for i in np.nonzero(keep)[0]])
+    return _largest_polygon(union)
+
+def rectilinear_room(half_length, n_rects=4, grid=0.5, rng=None):
+    """rectilinear_room
+
+    Function return union of axis-aligned rectangles snapped to grid, each containing the origin,
+    so result is a connected rectilinear polygon without holes (L, T, cross shaped and so on).
+
+    Args:
+        half_length (float): Max distance of rectangle sides from origin.
+        n_rects (int): Number of rectangles.
+        grid (float): Grid size sides are snapped to.
+        rng (Generator): Random source. Global np.random state is used if None.
+
+    Returns:
+        Polygon: Room area.
+
+    """
+    rng = get_rng(rng)
+    cells = max(int(np.floor(half_length / grid)), 1)
+    # (n_rects, [x_min, y_min, x_max, y_max]) in cells, every side at least one cell away from origin
+    sides = rng.integers(1, cells+1, size=(n_rects, 4)) if hasattr(rng, 'integers') else rng.randint(1, cells+1, size=(n_rects, 4))
+    sides = sides * grid * np.array([-1, -1, 1, 1])
+    return _largest_polygon(unary_union([box(*s) for s in sides]))
+
+WALL_STYLES = ['convex', 'alpha', 'rectilinear']
+
+def wall_from_room(room_poly, thickness):
+    '''
+    Mitre wall of thickness around room_poly with exactly one hole. Necks too narrow for the wall are cut off first.
+    '''
+    wall = room_poly.exterior.buffer(thickness, join_style=2)
+    radius = thickness
+    while len(wall.interiors) != 1:
+        opened = room_poly.buffer(-radius, join_style=2).buffer(radius, join_style=2)
+        if opened.is_empty:
+            room_poly, opened = room_poly.convex_hull, room_poly.convex_hull
+        wall = _largest_polygon(opened).exterior.buffer(thickness, join_style=2)
+        radius *= 2
+    return wall
+
+def random_room(style, room_length_max, rng=None, **kwargs):
+    '''
+    Room area of style in WALL_STYLES fitting in a square of side room_length_max. kwargs go to the style function.
+    '''
+    half_length = room_length_max / 2
+    if style == 'convex':
+        return convex_room(half_length, kwargs.pop('n_points', int(room_length_max*6)), rng=rng, **kwargs)
+    if style == 'alpha':
+        return alpha_room(half_length, kwargs.pop('n_points', int(room_length_max*6)), rng=rng, **kwargs)
+    if style == 'rectilinear':
+        return rectilinear_room(half_length, rng=rng, **kwargs)
+    raise ValueError('unknown wall style: {}'.format(style))
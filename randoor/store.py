@@ -0,0 +1,311 @@
+import os
+import numpy as np
+from shapely.geometry import Polygon, MultiPolygon
+
+FORMAT_MAGIC = 0x524e4452 # 'RNDR'
+FORMAT_VERSION = 1
+HEAD_SIZE = 12
+
+EXTRA_INT = 0
+EXTRA_GEOM = 1
+EXTRA_GEOM_LIST = 2
+
+SHARD_DATA = 'shard-{:05d}.bin'
+SHARD_INDEX = 'shard-{:05d}.idx'
+
+def get_room_classes():
+    from .generator import EmptyRoomConfig, ObstacleRoomConfig, SimpleSearchRoomConfig, ChestSearchRoomConfig
+    return dict((c.__name__, c) for c in [EmptyRoomConfig, ObstacleRoomConfig, SimpleSearchRoomConfig, ChestSearchRoomConfig])
+
+def _init_params(cls):
+    code = cls.__init__.__code__
+    return code.co_varnames[1:code.co_argcount]
+
+def _polygon_parts(geom):
+    if geom is None or geom.is_empty:
+        return []
+    if isinstance(geom, Polygon):
+        return [geom]
+    return [p for g in geom.geoms for p in _polygon_parts(g)]
+
+class _GeomTable(object):
+    '''
+    Flatten geometries into ragged arrays: geom -> polygons -> rings -> coords.
+    '''
+    def __init__(self):
+        self.ids = dict()
+        self.geom_offsets = [0]
+        self.poly_offsets = [0]
+        self.ring_offsets = [0]
+        self.coords = []
+        self.n_coords = 0
+
+    def add(self, geom):
+        key = id(geom)
+        if key in self.ids:
+            return self.ids[key]
+        for p in _polygon_parts(geom):
+            for ring in [p.exterior] + list(p.interiors):
+                c = np.asarray(ring.coords)[:-1,:2] # drop closing vertex
+                self.coords.append(c)
+                self.n_coords += len(c)
+                self.ring_offsets.append(self.n_coords)
+            self.poly_offsets.append(len(self.ring_offsets)-1)
+        self.geom_offsets.append(len(self.poly_offsets)-1)
+        self.ids[key] = len(self.geom_offsets)-2
+        return self.ids[key]
+
+    def coords_array(self):
+        if len(self.coords) == 0:
+            return np.empty([0,2], dtype=np.float32)
+        return np.concatenate(self.coords).astype(np.float32)
+
+def _pad4(b):
+    return b + b'\0' * (-len(b) % 4)
+
+def pack_room(room):
+    """pack_room
+
+    Function return binary record of room. Every section is a contiguous int32/float32 array,
+    geometries are stored as vertex rings with offset tables.
+
+    Args:
+        room (RoomConfig): Room to serialize.
+
+    Returns:
+        bytes: Record whose length is a multiple of 4.
+
+    """
+    table = _GeomTable()
+    tags = room.get_tags()
+
+    tag_info = np.empty([len(tags), 3], dtype=np.int32)
+    collisions, positions, items = [], [], []
+    for i, tag in enumerate(tags):
+        polys = room.get_polygons(tag)
+        tag_info[i] = [table.add(room.get_baseshape(tag)), len(items), len(polys)]
+        collisions.append(np.asarray(room.get_collisions(tag), dtype=np.int32))
+        positions.append(np.asarray(room.get_positions(tag), dtype=np.float32).reshape(-1,3))
+        items.extend(table.add(p) for p in polys)
+
+    extra_names = _init_params(type(room))
+    extra_info = np.empty([len(extra_names), 3], dtype=np.int32)
+    for i, name in enumerate(extra_names):
+        value = getattr(room, name)
+        if isinstance(value, (int, np.integer)):
+            extra_info[i] = [EXTRA_INT, value, 0]
+        elif hasattr(value, 'geom_type'):
+            extra_info[i] = [EXTRA_GEOM, table.add(value), 1]
+        else:
+            ids = [table.add(g) for g in value]
+            extra_info[i] = [EXTRA_GEOM_LIST, len(items), len(ids)]
+            items.extend(ids)
+
+    names = _pad4('\n'.join([type(room).__name__] + tags + list(extra_names)).encode('utf-8'))
+    coords = table.coords_array()
+    head = np.array([
+        FORMAT_MAGIC, FORMAT_VERSION, len(names), len(tags), len(extra_names), len(items),
+        len(table.geom_offsets), len(table.poly_offsets), len(table.ring_offsets), len(coords), 0, 0
+    ], dtype=np.int32)
+
+    sections = [
+        head, tag_info, extra_info, np.array(items, dtype=np.int32),
+        np.concatenate(collisions) if len(collisions) else np.empty([0], dtype=np.int32),
+        np.concatenate(positions) if len(positions) else np.empty([0,3], dtype=np.float32),
+        np.array(table.geom_offsets, dtype=np.int32),
+        np.array(table.poly_offsets, dtype=np.int32),
+        np.array(table.ring_offsets, dtype=np.int32),
+        coords,
+    ]
+    return head.tobytes() + names + b''.join(s.tobytes() for s in sections[1:])
+
+class PackedRoom(object):
+    '''
+    Read-only view of a packed room. Arrays are views into the record, polygons are rebuilt on first access.
+    '''
+    def __init__(self, buf):
+        raw = np.frombuffer(buf, dtype=np.uint8) if not isinstance(buf, np.ndarray) else buf.view(np.uint8)
+        head = raw[:HEAD_SIZE*4].view(np.int32)
+        assert head[0] == FORMAT_MAGIC, 'not a packed room'
+        assert head[1] == FORMAT_VERSION, 'unsupported format version'
+        n_names, n_tags, n_extras, n_items, n_geom_off, n_poly_off, n_ring_off, n_coords = [int(v) for v in head[2:10]]
+
+        self._raw = raw
+        self._pos = HEAD_SIZE*4
+        names = raw[self._pos:self._pos+n_names].tobytes().rstrip(b'\0').decode('utf-8').split('\n')
+        self._pos += n_names
+
+        self.class_name = names[0]
+        self.tags = names[1:1+n_tags]
+        self.extra_names = names[1+n_tags:]
+        self.tag_info = self._take(n_tags, width=3)
+        self.extra_info = self._take(n_extras, width=3)
+        self.items = self._take(n_items)
+        self.collisions = self._take(int(self.tag_info[:,2].sum()) if n_tags else 0)
+        self.positions = self._take(len(self.collisions), np.float32, 3)
+        self.geom_offsets = self._take(n_geom_off)
+        self.poly_offsets = self._take(n_poly_off)
+        self.ring_offsets = self._take(n_ring_off)
+        self.coords = self._take(n_coords, np.float32, 2)
+
+        self.tag_index = dict((t, i) for i, t in enumerate(self.tags))
+        self._geoms = dict()
+
+    def _take(self, count, dtype=np.int32, width=1):
+        size = count*width*4
+        section = self._raw[self._pos:self._pos+size].view(dtype)
+        self._pos += size
+        return section.reshape(count, width) if width > 1 else section
+
+    def _item_range(self, tag):
+        _, start, count = self.tag_info[self.tag_index[tag]]
+        return start, start+count
+
+    def get_geometry(self, geom_id):
+        if geom_id in self._geoms:
+            return self._geoms[geom_id]
+        polys = []
+        for p in range(self.geom_offsets[geom_id], self.geom_offsets[geom_id+1]):
+            rings = [self.coords[self.ring_offsets[r]:self.ring_offsets[r+1]].astype(np.float64) for r in range(self.poly_offsets[p], self.poly_offsets[p+1])]
+            polys.append(Polygon(rings[0], rings[1:]))
+        if len(polys) == 0:
+            geom = Polygon()
+        elif len(polys) == 1:
+            geom = polys[0]
+        else:
+            geom = MultiPolygon(polys)
+        self._geoms[geom_id] = geom
+        return geom
+
+    def get_collisions(self, component_tag):
+        start, end = self._item_range(component_tag)
+        return self.collisions[start:end].astype(bool)
+
+    def get_positions(self, component_tag):
+        start, end = self._item_range(component_tag)
+        return self.positions[start:end]
+
+    def get_baseshape(self, component_tag):
+        return self.get_geometry(self.tag_info[self.tag_index[component_tag]][0])
+
+    def get_polygons(self, component_tag):
+        start, end = self._item_range(component_tag)
+        polys = np.empty([end-start], dtype=object)
+        polys[:] = [self.get_geometry(g) for g in self.items[start:end]]
+        return polys
+
+    def get_extra(self, name):
+        kind, a, b = self.extra_info[self.extra_names.index(name)]
+        if kind == EXTRA_INT:
+            return int(a)
+        if kind == EXTRA_GEOM:
+            return self.get_geometry(a)
+        return [self.get_geometry(g) for g in self.items[a:a+b]]
+
+    def to_room(self):
+        '''
+        Rebuild RoomConfig of the original class.
+        '''
+        cls = get_room_classes()[self.class_name]
+        room = cls(**dict((n, self.get_extra(n)) for n in self.extra_names))
+        room.prepare()
+        for tag in self.tags:
+            room.set_config_all(tag, self.get_collisions(tag), self.get_positions(tag).astype(np.float64), self.get_baseshape(tag))
+            room.set_polygons_direct(tag, self.get_polygons(tag))
+        return room
+
+def unpack_room(buf):
+    return PackedRoom(buf).to_room()
+
+class RoomStoreWriter(object):
+    '''
+    Append packed rooms to shards of directory path. Each shard is a data file of concatenated records
+    and an index file of int64 record offsets.
+    '''
+    def __init__(self, path, shard_size=100000):
+        self.path = path
+        self.shard_size = shard_size
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.shard = len([f for f in os.listdir(path) if f.endswith('.idx')])
+        self.data_file = None
+        self.index_file = None
+
+    def _open_shard(self):
+        self.data_file = open(os.path.join(self.path, SHARD_DATA.format(self.shard)), 'wb')
+        self.index_file = open(os.path.join(self.path, SHARD_INDEX.format(self.shard)), 'wb')
+        self.index_file.write(np.array([0], dtype=np.int64).tobytes())
+        self.offset = 0
+        self.count = 0
+
+    def _close_shard(self):
+        if self.data_file is not None:
+            self.data_file.close()
+            self.index_file.close()
+            self.data_file = None
+            self.index_file = None
+            self.shard += 1
+
+    def append(self, room):
+        if self.data_file is None:
+            self._open_shard()
+        record = room if isinstance(room, bytes) else pack_room(room)
+        self.data_file.write(record)
+        self.offset += len(record)
+        self.index_file.write(np.array([self.offset], dtype=np.int64).tobytes())
+        self.count += 1
+        if self.count >= self.shard_size:
+            self._close_shard()
+
+    def extend(self, rooms):
+        for room in rooms:
+            self.append(room)
+
+    def close(self):
+        self._close_shard()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class RoomStore(object):
+    '''
+    Random access to rooms written by RoomStoreWriter. Shards are memory-mapped, store[i] returns PackedRoom.
+    '''
+    def __init__(self, path):
+        self.path = path
+        n_shards = len([f for f in os.listdir(path) if f.endswith('.idx')])
+        self.indices = [np.fromfile(os.path.join(path, SHARD_INDEX.format(i)), dtype=np.int64) for i in range(n_shards)]
+        self.data = [None] * n_shards
+        self.starts = np.cumsum([0] + [len(idx)-1 for idx in self.indices])
+
+    def _shard_data(self, shard):
+        if self.data[shard] is None:
+            filename = os.path.join(self.path, SHARD_DATA.format(shard))
+            if os.path.getsize(filename) == 0:
+                self.data[shard] = np.empty([0], dtype=np.uint8)
+            else:
+                self.data[shard] = np.memmap(filename, dtype=np.uint8, mode='r')
+        return self.data[shard]
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    def get_record(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('room index out of range')
+        shard = int(np.searchsorted(self.starts, index, side='right')) - 1
+        local = index - self.starts[shard]
+        offsets = self.indices[shard]
+        return self._shard_data(shard)[offsets[local]:offsets[local+1]]
+
+    def __getitem__(self, index):
+        return PackedRoom(self.get_record(index))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
@@ -0,0 +1,127 @@
+import numpy as np
+from collections import OrderedDict
+
+from .raster import get_rings, polygon_edges, edges_mask, colorize
+
+class TiledOccupancy(object):
+    '''
+    Pyramid of world-aligned occupancy tiles of a space polygon. Level l has resolution base_resolution * 2**l.
+    Tiles are rendered on first access and kept in a LRU cache of cache_size tiles.
+    '''
+    def __init__(self, get_space_poly, base_resolution=0.05, tile_size=64, levels=4, cache_size=512):
+        self.get_space_poly = get_space_poly
+        self.base_resolution = base_resolution
+        self.tile_size = tile_size
+        self.levels = levels
+        self.cache_size = cache_size
+
+        self.tiles = OrderedDict()
+        self.empty_tile = np.zeros([tile_size, tile_size], dtype=bool)
+        self.empty_tile.flags.writeable = False
+        self.part_edges = None
+        self.space_bounds = None
+
+    def level_resolution(self, level):
+        return self.base_resolution * 2**level
+
+    def choose_level(self, resolution):
+        '''
+        Coarsest level whose resolution is not coarser than resolution.
+        '''
+        level = int(np.floor(np.log2(resolution / self.base_resolution) + 1e-9)) if resolution > self.base_resolution else 0
+        return min(max(level, 0), self.levels-1)
+
+    def _prepare_space(self):
+        if self.part_edges is None:
+            space_poly = self.get_space_poly()
+            self.part_edges = polygon_edges(get_rings(space_poly))
+            self.space_bounds = space_poly.bounds if not space_poly.is_empty else None
+
+    def invalidate_bounds(self, bounds_list):
+        '''
+        Drop tiles overlapping world bounds, space polygon is fetched again on next render.
+        '''
+        self.part_edges = None
+        if len(bounds_list) == 0 or len(self.tiles) == 0:
+            return
+        b = np.asarray(bounds_list, dtype=float).reshape(-1,4)
+        for key in list(self.tiles.keys()):
+            level, tx, ty = key
+            span = self.tile_size * self.level_resolution(level)
+            hit = (b[:,0] <= (tx+1)*span) & (b[:,2] >= tx*span) & (b[:,1] <= (ty+1)*span) & (b[:,3] >= ty*span)
+            if hit.any():
+                del self.tiles[key]
+
+    def clear(self):
+        self.tiles.clear()
+        self.part_edges = None
+
+    def get_tile(self, level, tx, ty):
+        '''
+        (tile_size, tile_size) bool mask, row for y and column for x, pixel centers at (index + 0.5) * resolution.
+        '''
+        key = (level, tx, ty)
+        if key in self.tiles:
+            tile = self.tiles.pop(key)
+            self.tiles[key] = tile
+            return tile
+
+        self._prepare_space()
+        res = self.level_resolution(level)
+        span = self.tile_size * res
+        sb = self.space_bounds
+        if (sb is None) or (sb[0] > (tx+1)*span) or (sb[2] < tx*span) or (sb[1] > (ty+1)*span) or (sb[3] < ty*span):
+            return self.empty_tile
+
+        axis = (np.arange(self.tile_size) + 0.5) * res
+        tile = edges_mask(self.part_edges, tx*span + axis, ty*span + axis)
+        tile.flags.writeable = False
+        self.tiles[key] = tile
+        while len(self.tiles) > self.cache_size:
+            self.tiles.popitem(last=False)
+        return tile
+
+    def sample(self, xs, ys, level):
+        '''
+        Nearest pixel value of level for world points.
+        '''
+        res = self.level_resolution(level)
+        t = self.tile_size
+        gx = np.floor(np.asarray(xs) / res).astype(np.int64)
+        gy = np.floor(np.asarray(ys) / res).astype(np.int64)
+        tx0, tx1 = gx.min() // t, gx.max() // t
+        ty0, ty1 = gy.min() // t, gy.max() // t
+
+        # paste covering tiles into one mosaic, then index it once
+        mosaic = np.empty([(ty1-ty0+1)*t, (tx1-tx0+1)*t], dtype=bool)
+        for ty in range(ty0, ty1+1):
+            for tx in range(tx0, tx1+1):
+                mosaic[(ty-ty0)*t:(ty-ty0+1)*t, (tx-tx0)*t:(tx-tx0+1)*t] = self.get_tile(level, int(tx), int(ty))
+        return mosaic[gy - ty0*t, gx - tx0*t]
+
+    def get_crop(self, origin_pos=(0,0), origin_ori=0, resolution=0.05, map_size=512):
+        """get_crop
+
+        Function return occupancy mask around origin assembled from tiles, with the same pixel layout
+        as get_occupancy_grid. Values are nearest pixels of the level chosen by resolution.
+
+        Args:
+            origin_pos ((float,float)): Center of crop.
+            origin_ori (float): Yaw of crop.
+            resolution (float): Length of a pixel.
+            map_size (int): Pixel count of each side.
+
+        Returns:
+            ndarray: (map_size, map_size) bool mask.
+
+        """
+        half_length = (map_size * resolution) / 2
+        lin = np.linspace(-half_length, half_length, map_size)
+        xx, yy = np.meshgrid(lin, lin)
+        c, s = np.cos(origin_ori), np.sin(origin_ori)
+        wx = c*xx - s*yy + origin_pos[0]
+        wy = s*xx + c*yy + origin_pos[1]
+        return self.sample(wx, wy, self.choose_level(resolution))
+
+    def get_crop_grid(self, origin_pos=(0,0), origin_ori=0, resolution=0.05, map_size=512, pass_color=255, obs_color=0):
+        return colorize(self.get_crop(origin_pos, origin_ori, resolution, map_size), pass_color, obs_color)
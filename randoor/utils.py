@@ -1,5 +1,4 @@
 import numpy as np
-import quaternion
 
 def vec_to_transform_matrix(vec):
     a = np.identity(len(vec)+1)
@@ -13,59 +12,149 @@ def radian_to_rotation_matrix(radian):
         [0,0,1]
     ])
 
+def get_rectangle_horizon(base_xy, half_size, z_angle=0):
+    """
+    Vertices of rectangles rotated by z_angle around each base_xy.
+    base_xy (N,2), half_size (N,) or (N,2), z_angle (N,) -> (N,4,2)
+    """
+    base_xy = np.asarray(base_xy, dtype=float).reshape(-1,2)
+    n = len(base_xy)
+    half_size = np.broadcast_to(np.asarray(half_size, dtype=float).reshape(-1,1) if np.ndim(half_size) < 2 else half_size, (n,2))
+    z_angle = np.broadcast_to(np.asarray(z_angle, dtype=float).reshape(-1), (n,))
+    c = np.cos(z_angle)[:,np.newaxis]
+    s = np.sin(z_angle)[:,np.newaxis]
+    dx = np.array([1,1,-1,-1]) * half_size[:,0,np.newaxis]
+    dy = np.array([1,-1,-1,1]) * half_size[:,1,np.newaxis]
+    vertices = np.empty([n,4,2])
+    vertices[:,:,0] = c*dx - s*dy + base_xy[:,0,np.newaxis]
+    vertices[:,:,1] = s*dx + c*dy + base_xy[:,1,np.newaxis]
+    return vertices
+
 def get_square_horizon(base_xy, radius, z_angle=0):
-    d1 = [1,1,-1,-1]
-    d2 = [1,-1,-1,1]
-    poss = np.array([np.quaternion(1,d1[i]*radius,d2[i]*radius,0) for i in range(4)])
-    q = quaternion.from_euler_angles(0,0,z_angle)
-    pq = q*poss*q.conj()
-    return np.array([[p.x, p.y] for p in pq])+base_xy
+    return get_rectangle_horizon(base_xy, radius, z_angle)[0]
+
+def get_rng(rng=None):
+    '''
+    None -> global np.random state, int -> new Generator, Generator -> itself
+    '''
+    if rng is None:
+        return np.random
+    if isinstance(rng, (int, np.integer, np.random.SeedSequence)):
+        return np.random.default_rng(rng)
+    return rng
 
 def add_dimension(vecs, value=0):
     return np.concatenate([vecs[np.newaxis,:,i].T if i<len(vecs[0]) else np.full([len(vecs),1], value) for i in range(len(vecs[0])+1)], axis=1)
 
-def convert_180(rad360):
+def convert_180(rad360, out=None):
     '''
-    [0,360] -> [-180,180]
+    [0,360] -> [-180,180], elementwise for arrays. out: optional array to write into.
     '''
-    return ((rad360 - np.pi) % (np.pi*2)) - np.pi
+    if out is None:
+        return ((rad360 - np.pi) % (np.pi*2)) - np.pi
+    np.subtract(rad360, np.pi, out=out)
+    np.mod(out, np.pi*2, out=out)
+    out -= np.pi
+    return out
 
-def convert_360(rad180):
+def convert_360(rad180, out=None):
     '''
-    [-180,180] -> [0,360]
+    [-180,180] -> [0,360], elementwise for arrays. out: optional array to write into.
     '''
-    return rad180 % (np.pi*2)
+    if out is None:
+        return rad180 % (np.pi*2)
+    return np.mod(rad180, np.pi*2, out=out)
 
 def transform_2d(target_x, target_y, target_yaw, origin_x, origin_y, origin_yaw):
-    t_mat = np.identity(3)
-    t_mat[:2,2] = [-origin_x, -origin_y]
-    r_mat = np.array([
-                [np.cos(-origin_yaw), -np.sin(-origin_yaw), 0],
-                [np.sin(-origin_yaw), np.cos(-origin_yaw), 0],
-                [0, 0, 1]
-            ])
-    af = np.dot(r_mat, t_mat)
-    target_xy = np.array([target_x, target_y, 1])
-    transed_xy = np.dot(af, target_xy)
-    
-    return transed_xy[0], transed_xy[1], convert_180(target_yaw - origin_yaw)
-
-def get_affine_tf_rt(x, y, yaw):
+    '''
+    Pose of target in the frame of origin. Arguments broadcast, so arrays give arrays of the broadcast shape.
+    '''
+    dx = np.subtract(target_x, origin_x)
+    dy = np.subtract(target_y, origin_y)
+    c, s = np.cos(origin_yaw), np.sin(origin_yaw)
+    return c*dx + s*dy, c*dy - s*dx, convert_180(np.subtract(target_yaw, origin_yaw))
+
+def transform_poses_2d(target_poses, origin_poses, out=None, scratch=None):
+    """transform_poses_2d
+
+    Function return poses of all targets in the frames of all origins, same as transform_2d for every pair.
+
+    Args:
+        target_poses (ndarray): (N,3) x, y, yaw of targets.
+        origin_poses (ndarray): (M,3) x, y, yaw of origins, e.g. agents.
+        out (ndarray): Optional (M,N,3) float array to write into, reused across steps to avoid allocation.
+        scratch (ndarray): Optional (M,N) float array for intermediate products, reused like out.
+            With both given, only (M,) and (N,) sized temporaries are allocated.
+
+    Returns:
+        ndarray: (M,N,3) relative poses, yaw in [-pi, pi).
+
+    """
+    targets = np.asarray(target_poses, dtype=float).reshape(-1,3)
+    origins = np.asarray(origin_poses, dtype=float).reshape(-1,3)
+    if out is None:
+        out = np.empty([len(origins), len(targets), 3])
+    if scratch is None:
+        scratch = np.empty([len(origins), len(targets)])
+    c = np.cos(origins[:,2])[:,np.newaxis]
+    s = np.sin(origins[:,2])[:,np.newaxis]
+    x, y, yaw = out[:,:,0], out[:,:,1], out[:,:,2]
+    np.subtract(targets[np.newaxis,:,0], origins[:,0,np.newaxis], out=x)
+    np.subtract(targets[np.newaxis,:,1], origins[:,1,np.newaxis], out=y)
+    # rotate (dx, dy) by -yaw of origin, yaw is a second scratch buffer until the end
+    np.multiply(s, y, out=scratch)
+    np.multiply(s, x, out=yaw)
+    x *= c
+    x += scratch
+    y *= c
+    y -= yaw
+    np.subtract(targets[np.newaxis,:,2], origins[:,2,np.newaxis], out=yaw)
+    convert_180(yaw, out=yaw)
+    return out
+
+def _affines(x, y, yaw, out):
+    x, y, yaw = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float), np.asarray(yaw, dtype=float))
+    if out is None:
+        out = np.empty(x.shape + (3,3))
+    c, s = np.cos(yaw), np.sin(yaw)
+    out[...,0,0] = c
+    out[...,0,1] = -s
+    out[...,1,0] = s
+    out[...,1,1] = c
+    out[...,2,:2] = 0
+    out[...,2,2] = 1
+    return x, y, c, s, out
+
+def get_affine_tf_rt(x, y, yaw, out=None):
     """
     Notice: Calculation with transform -> rotate
+    Arrays of poses give (..., 3, 3) matrices. out: optional array to write into.
+    """
+    x, y, _, _, out = _affines(x, y, yaw, out)
+    out[...,0,2] = x
+    out[...,1,2] = y
+    return out
+
+def transform_points_tf_rt(points, x_y_yaw):
+    """
+    Notice: Same calculation as get_affine_tf_rt for each pose.
+    points (k,2), x_y_yaw (N,3) -> (N,k,2)
     """
-    rotate = radian_to_rotation_matrix(yaw)
-    # trans = vec_to_transform_matrix([y,-x])
-    trans = vec_to_transform_matrix([x,y])
-    affine = np.dot(trans, rotate)
-    return affine
+    points = np.asarray(points, dtype=float)
+    x_y_yaw = np.asarray(x_y_yaw, dtype=float).reshape(-1,3)
+    c = np.cos(x_y_yaw[:,2])[:,np.newaxis]
+    s = np.sin(x_y_yaw[:,2])[:,np.newaxis]
+    moved = np.empty([len(x_y_yaw), len(points), 2])
+    moved[:,:,0] = c*points[:,0] - s*points[:,1] + x_y_yaw[:,0,np.newaxis]
+    moved[:,:,1] = s*points[:,0] + c*points[:,1] + x_y_yaw[:,1,np.newaxis]
+    return moved
 
-def get_affine_rt_tf(x, y, yaw):
+def get_affine_rt_tf(x, y, yaw, out=None):
     """
     Notice: rotate -> transform
+    Arrays of poses give (..., 3, 3) matrices. out: optional array to write into.
     """
-    rotate = radian_to_rotation_matrix(yaw)
-    # trans = vec_to_transform_matrix([y,-x])
-    trans = vec_to_transform_matrix([x,y])
-    affine = np.dot(rotate, trans)
-    return affine
\ No newline at end of file
+    x, y, c, s, out = _affines(x, y, yaw, out)
+    out[...,0,2] = c*x - s*y
+    out[...,1,2] = s*x + c*y
+    return out
\ No newline at end of file
@@ -0,0 +1,39 @@
+'''
+cluster_points gives the labels of sklearn.cluster.DBSCAN(eps, min_samples=1). Skipped without sklearn, which is optional.
+'''
+import numpy as np
+import pytest
+
+from randoor.spawner.geom import cluster_points
+
+DBSCAN = pytest.importorskip('sklearn.cluster').DBSCAN
+
+def dbscan_labels(points, eps):
+    return DBSCAN(eps=eps, min_samples=1).fit(points).labels_
+
+def test_random_point_sets():
+    rng = np.random.default_rng(0)
+    for _ in range(3000):
+        n = rng.integers(1, 200)
+        scale = 10.0 ** rng.uniform(-2, 2)
+        points = rng.random([n, 2]) * scale
+        eps = rng.uniform(0.01, 0.3) * scale
+        np.testing.assert_array_equal(cluster_points(points, eps), dbscan_labels(points, eps))
+
+def test_ties_at_eps():
+    # integer lattice, distances of 1, 5 (3-4-5) and sqrt(2) fall exactly on or next to eps
+    rng = np.random.default_rng(1)
+    for eps in [1.0, 2.0, 5.0, np.sqrt(2.0)]:
+        for _ in range(200):
+            points = rng.integers(0, 12, [rng.integers(2, 60), 2]).astype(float)
+            np.testing.assert_array_equal(cluster_points(points, eps), dbscan_labels(points, eps))
+
+def test_exact_tie_is_linked():
+    points = np.array([[0.0, 0.0], [3.0, 4.0], [6.0, 8.0], [6.0, 8.0 + 5.0 + 1e-9]])
+    np.testing.assert_array_equal(cluster_points(points, 5.0), [0, 0, 0, 1])
+    np.testing.assert_array_equal(cluster_points(points, 5.0), dbscan_labels(points, 5.0))
+
+def test_duplicates_and_empty():
+    points = np.array([[1.0, 1.0], [1.0, 1.0], [2.0, 2.0]])
+    np.testing.assert_array_equal(cluster_points(points, 0.5), dbscan_labels(points, 0.5))
+    assert len(cluster_points(np.empty([0, 2]), 1.0)) == 0
\ No newline at end of file
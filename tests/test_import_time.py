@@ -0,0 +1,28 @@
+'''
+Dependencies that must load only on first use. The wall-clock budget of benchmarks/bench_import.py depends on the machine,
+so it is checked only when RANDOOR_IMPORT_BUDGET is set.
+'''
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmarks import bench_import
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LAZY_MODULES = ['sklearn', 'multiprocessing', 'trimesh', 'quaternion']
+
+@pytest.mark.skipif(not os.environ.get('RANDOOR_IMPORT_BUDGET'), reason='set RANDOOR_IMPORT_BUDGET to check the import time budget')
+def test_import_within_budget(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    assert bench_import.main(['--module', 'randoor.generator']) == 0
+
+@pytest.mark.parametrize('module', ['randoor', 'randoor.generator', 'randoor.cache'])
+def test_lazy_modules_not_imported(module):
+    statement = 'import sys, {}; print(" ".join(m for m in {!r} if m in sys.modules))'.format(module, LAZY_MODULES)
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([ROOT] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+    loaded = subprocess.check_output([sys.executable, '-c', statement], cwd=ROOT, env=env).decode().split()
+    assert loaded == []
\ No newline at end of file
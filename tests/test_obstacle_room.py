@@ -0,0 +1,36 @@
+'''
+Rooms too small for their obstacles are rejected and drawn again in both placement modes.
+'''
+import numpy as np
+import pytest
+from shapely.geometry import Polygon
+
+from randoor import profiling
+from randoor.generator import ObstacleRoomGenerator, RoomRejected
+from randoor.spawner.geom import SamplingError, sample_spaced
+
+@pytest.mark.parametrize('placement', ['random', 'spaced'])
+def test_small_rooms_are_drawn_again(placement):
+    generator = ObstacleRoomGenerator(obstacle_count=1, room_length_max=3, obstacle_placement=placement)
+    generator.rng = np.random.default_rng(0)
+    with profiling.profile() as prof:
+        rooms = [generator.generate_new() for _ in range(60)]
+    assert all(len(r.get_polygons(r.tag_obstacle)) == 1 for r in rooms)
+    assert prof.totals['counters']['rejected'] > 0
+
+@pytest.mark.parametrize('placement', ['random', 'spaced'])
+def test_small_rooms_in_batch(placement):
+    generator = ObstacleRoomGenerator(obstacle_count=1, room_length_max=3, obstacle_placement=placement)
+    assert len(list(generator.generate_batch(30, seed=0, workers=1))) == 30
+
+@pytest.mark.parametrize('placement', ['random', 'spaced'])
+def test_rejection_reason_after_max_attempts(placement):
+    generator = ObstacleRoomGenerator(obstacle_count=10, room_length_max=3, obstacle_size=1.5, obstacle_placement=placement)
+    generator.rng = np.random.default_rng(0)
+    with pytest.raises(RoomRejected) as info:
+        generator.generate_new(max_attempts=5)
+    assert ('sampling area is empty' in str(info.value)) or ('could not place' in str(info.value))
+
+def test_sample_spaced_empty_area():
+    with pytest.raises(SamplingError, match='sampling area is empty'):
+        sample_spaced(Polygon([(0, 0), (1, 0), (1, 1), (0, 1)]), 3, 0.1, sample_thresh=1.0)
\ No newline at end of file
@@ -0,0 +1,54 @@
+'''
+Layout arrays are changed only through RoomConfig methods, so cached geometry never goes stale.
+'''
+import numpy as np
+import pytest
+from shapely.geometry import Polygon
+
+from randoor.generator import SimpleSearchRoomGenerator
+
+@pytest.fixture
+def room():
+    return next(SimpleSearchRoomGenerator(obstacle_count=10).generate_batch(1, seed=0, workers=1))
+
+def test_views_are_read_only(room):
+    for tag in room.get_tags():
+        with pytest.raises(ValueError):
+            room.get_positions(tag)[0, 0] = 1.0
+        with pytest.raises(ValueError):
+            room.get_collisions(tag)[0] = False
+        entry = room.config[tag]
+        assert not entry[room.conf_tag_positions].flags.writeable
+        assert not entry[room.conf_tag_collisions].flags.writeable
+
+def test_tweak_collision_invalidates(room):
+    before = room.get_freespace_poly().area
+    room.tweak_collision(room.tag_obstacle, 0, False)
+    assert not room.get_collisions(room.tag_obstacle)[0]
+    assert room.get_freespace_poly().area > before
+
+def test_replacing_hulls_invalidates(room):
+    before = room.get_freezone_poly()
+    room.obstacle_hulls = [Polygon()]
+    assert room.get_freezone_poly().area > before.area
+def test_assigning_config_and_polygons(room):
+    room.get_collision_union(room.tag_obstacle)
+    positions = np.array(room.get_positions(room.tag_obstacle))
+    positions[:, :2] += 100.0
+    room.config = {room.tag_obstacle: {room.conf_tag_positions: positions}}
+    room.set_polygons_auto(room.tag_obstacle)
+    np.testing.assert_array_equal(room.get_positions(room.tag_obstacle), positions)
+    assert room.get_collision_union(room.tag_obstacle).bounds[0] > 90.0
+
+    room.polygons = {room.tag_obstacle: []}
+    assert len(room.get_polygons(room.tag_obstacle)) == 0
+    assert room.get_collision_poly().equals(room.get_collision_union(room.tag_wall).union(room.get_collision_union(room.tag_target)))
+
+def test_fork_copies_dict(room):
+    # subclasses without __slots__ keep their attributes in __dict__
+    cls = type('TaggedRoom', (type(room),), {})
+    tagged = cls(room.wall_shape, room.obstacle_shape, room.target_shape, room.obstacle_count, room.target_count, room.obstacle_hulls)
+    tagged.note = 'kept'
+    forked = tagged.fork()
+    assert forked.note == 'kept'
+    assert forked.obstacle_hulls is room.obstacle_hulls
\ No newline at end of file
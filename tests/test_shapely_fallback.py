@@ -0,0 +1,104 @@
+'''
+Fast paths for shapely >= 2.0 and their shapely < 2.0 fallbacks give the same rooms and query results.
+Fallbacks are run on the installed shapely in a subprocess whose "shapely" package has only the submodules
+of shapely 1.x, so every "from shapely import <2.0 function>" takes its except ImportError branch.
+'''
+import os
+import pickle
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HIDE_SHAPELY_2 = '''
+import sys, types
+import shapely, shapely.geometry, shapely.ops, shapely.affinity, shapely.errors, shapely.strtree, shapely.prepared, shapely.vectorized
+legacy = types.ModuleType('shapely')
+for name in ['__version__', '__path__', '__file__', 'geometry', 'ops', 'affinity', 'errors', 'strtree', 'prepared', 'vectorized']:
+    setattr(legacy, name, getattr(shapely, name))
+sys.modules['shapely'] = legacy
+'''
+
+RUN_WORKLOAD = '''
+import pickle, sys
+from tests.test_shapely_fallback import workload
+out = getattr(sys.stdout, 'buffer', sys.stdout)
+pickle.dump(workload(), out, 2)
+out.flush()
+'''
+
+def workload():
+    '''
+    -> {name: array, wkb or flag} of rooms of all generators and queries on them.
+    '''
+    from randoor.generator import EmptyRoomGenerator, ObstacleRoomGenerator, SimpleSearchRoomGenerator, ChestSearchRoomGenerator
+    from randoor.spawner import poly, wall, geom
+    from randoor import index, nav, profiling
+
+    results = dict(fallback=[
+        poly.shapely_polygons is None,
+        wall.multipoints is None,
+        geom.centroid is None,
+        index.STRtree is None,
+        nav.shapely_points is None,
+        profiling.get_num_coordinates is None,
+    ])
+    xs, ys = np.meshgrid(np.linspace(-4, 4, 9), np.linspace(-4, 4, 9))
+    xs, ys = xs.ravel(), ys.ravel()
+    for cls in [EmptyRoomGenerator, ObstacleRoomGenerator, SimpleSearchRoomGenerator, ChestSearchRoomGenerator]:
+        for style in wall.WALL_STYLES:
+            g = cls(wall_style=style) if cls is EmptyRoomGenerator else cls(obstacle_count=15, wall_style=style)
+            with profiling.profile() as prof:
+                rooms = list(g.generate_batch(2, seed=5, workers=1))
+            results[cls.__name__, style, 'vertices'] = np.array([s['vertices'] for s in prof.totals['stages'].values()])
+            for i, room in enumerate(rooms):
+                key = (cls.__name__, style, i)
+                for tag in room.get_tags():
+                    results[key + (tag, 'positions')] = room.get_positions(tag)
+                    results[key + (tag, 'polygons')] = [p.wkb for p in room.get_polygons(tag)]
+                results[key + ('grid',)] = room.get_freespace_grid(map_size=128)
+                results[key + ('free',)] = room.is_free(xs, ys)
+                results[key + ('query_point',)] = [sorted(room.query_point(x, y)) for x, y in zip(xs, ys)]
+                results[key + ('query_radius',)] = [sorted(room.query_radius(x, y, 0.5)) for x, y in zip(xs, ys)]
+                # nearest polygon is ambiguous at ties, its distance is not
+                results[key + ('nearest',)] = np.array([room.nearest(x, y)[2] for x, y in zip(xs, ys)])
+                results[key + ('scan',)] = room.simulate_scan(xs[:4], ys[:4], 0.0, 90, 10.0)
+                if hasattr(room, 'geodesic_distance'):
+                    targets = room.get_positions(room.tag_target)[:,:2]
+                    results[key + ('geodesic',)] = room.geodesic_distance(targets, targets, 'freespace')
+                    results[key + ('labels',)] = room.get_component_labels(np.stack([xs, ys], axis=1), 'freespace')
+    return results
+
+def assert_same(key, a, b):
+    from shapely import wkb
+    if isinstance(a, list) and (len(a) > 0) and isinstance(a[0], bytes):
+        assert len(a) == len(b), key
+        for p, q in zip(a, b):
+            assert wkb.loads(p).symmetric_difference(wkb.loads(q)).area < 1e-9, key
+    elif isinstance(a, list):
+        assert a == b, key
+    else:
+        np.testing.assert_allclose(a, b, atol=1e-9, err_msg=str(key))
+
+@pytest.fixture(scope='module')
+def fallback_results():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([ROOT] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+    out = subprocess.check_output([sys.executable, '-c', HIDE_SHAPELY_2 + RUN_WORKLOAD], cwd=ROOT, env=env)
+    return pickle.loads(out)
+
+def test_fallbacks_are_taken(fallback_results):
+    assert all(fallback_results['fallback'])
+
+def test_fallbacks_match_fast_paths(fallback_results):
+    results = workload()
+    if all(results['fallback']):
+        pytest.skip('shapely < 2.0 is installed, fast paths are not available')
+    assert not any(results['fallback'])
+    assert sorted(map(repr, results)) == sorted(map(repr, fallback_results))
+    for key, value in results.items():
+        if key != 'fallback':
+            assert_same(key, value, fallback_results[key])
\ No newline at end of file